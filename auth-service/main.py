@@ -1,35 +1,113 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Response
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from compression import CompressionMiddleware
+from diagnostics import Diagnostics
+from passwords import HasherBusy, PasswordHasher, hash_password
+from userstore import UserStore, UserTable
 
-app = FastAPI(title="AuthService")
+# Файл користувачів (рядки `email,id,password_hash`); без нього працюють вбудовані користувачі
+USERS_PATH = os.getenv("USERS_PATH")
+# Як часто перевіряти, чи змінився файл користувачів (0 — не перевіряти)
+USERS_REFRESH_SECONDS = float(os.getenv("USERS_REFRESH_SECONDS", "0"))
 
 # Простеньке "сховище" користувачів у пам'яті (для навчальних цілей)
-USERS = {
-    "alice@example.com": {"password": "alice123", "id": 1},
-    "bob@example.com": {"password": "bob123", "id": 2},
-}
+# Паролі зберігаються лише у вигляді хешів KDF
+USERS = UserStore(UserTable.from_records([
+    ("alice@example.com", 1, hash_password("alice123")),
+    ("bob@example.com", 2, hash_password("bob123")),
+]))
+
+# Максимальна кількість токенів в одному /whoami:batch
+WHOAMI_BATCH_MAX = int(os.getenv("WHOAMI_BATCH_MAX", "100"))
+# Адмін-маршрути діагностики (/admin/profile, /admin/loop-lag, /admin/inflight)
+ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "0") == "1"
+
+# Хеш для невідомих email: перевірка триває стільки ж, скільки для існуючого користувача
+DUMMY_HASH = hash_password("dummy-password")
+
+HASHER = PasswordHasher()
+DIAGNOSTICS = Diagnostics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    DIAGNOSTICS.start()
+    refresher = None
+    if USERS_PATH:
+        await USERS.load(USERS_PATH)
+        if USERS_REFRESH_SECONDS > 0:
+            refresher = asyncio.create_task(USERS.watch(USERS_PATH, USERS_REFRESH_SECONDS))
+    yield
+    if refresher:
+        refresher.cancel()
+    DIAGNOSTICS.stop()
+    HASHER.shutdown()
+
+
+app = FastAPI(title="AuthService", lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
+if ADMIN_ENABLED:
+    app.include_router(DIAGNOSTICS.router())
 
 
 @app.get("/login")
 async def login(email: str, password: str, response: Response):
-    user = USERS.get(email)
-    if not user or user["password"] != password:
+    user = USERS.current.lookup(email)
+    try:
+        # KDF виконується у пулі потоків — /whoami не чекає на логіни
+        with DIAGNOSTICS.inflight.track("kdf-pool"):
+            password_ok = await HASHER.verify(password, user.password_hash if user else DUMMY_HASH)
+    except HasherBusy:
+        return JSONResponse(
+            {"message": "too many login attempts, try again later"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    if not user or not password_ok:
         return JSONResponse({"message": "invalid credentials"}, status_code=200)
 
     # TOKЕН спрощений (НЕ використовуйте так у проді!)
     token = f"fake-token-for-{email}"
 
-    return {"accessToken": token, "userId": user["id"]}
+    return {"accessToken": token, "userId": user.id}
 
 
-@app.get("/whoami")
-async def whoami(authorization: str | None = None):
-    """
-    Стверджується, що токен подається як Bearer у заголовку Authorization.
-    """
+class WhoamiBatchRequest(BaseModel):
+    """Модель для пакетної перевірки токенів"""
+    tokens: list[str] = Field(max_length=WHOAMI_BATCH_MAX)
+
+
+def identify(authorization: str | None) -> dict:
+    """Спільна перевірка токена для /whoami та /whoami:batch"""
     if not authorization or not authorization.startswith("Bearer "):
-        return JSONResponse({"error": "missing or invalid token"}, status_code=200)
+        return {"error": "missing or invalid token"}
     token = authorization.removeprefix("Bearer ")
     # Немає перевірки підпису/строку дії — навчальний спрощений варіант
     email = token.replace("fake-token-for-", "")
     return {"email": email}
+
+
+@app.get("/whoami")
+async def whoami(authorization: str | None = None):
+    """
+    Стверджується, що токен подається як Bearer у заголовку Authorization.
+    """
+    identity = identify(authorization)
+    if "error" in identity:
+        return JSONResponse(identity, status_code=200)
+    return identity
+
+
+@app.post("/whoami:batch")
+async def whoami_batch(request: WhoamiBatchRequest):
+    """
+    Кожен елемент tokens — значення Authorization ("Bearer ..."), як у /whoami.
+    Результати (identity або error) повертаються у тому ж порядку.
+    """
+    return {"results": [identify(token) for token in request.tokens]}
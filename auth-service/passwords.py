@@ -0,0 +1,96 @@
+"""
+Хешування паролів (scrypt / PBKDF2) та перевірка у пулі потоків, поза циклом подій
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Алгоритм для нових хешів: scrypt або pbkdf2_sha256
+KDF = os.getenv("AUTH_KDF", "scrypt")
+SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", "16384"))
+SCRYPT_R = int(os.getenv("AUTH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("AUTH_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("AUTH_PBKDF2_ITERATIONS", "600000"))
+
+# hashlib відпускає GIL під час scrypt/PBKDF2, тому пулу потоків достатньо
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Скільки перевірок (разом із тими, що виконуються) може чекати пул;
+# решта логінів одразу отримує відмову, а не стоїть у черзі
+HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "64"))
+
+
+class HasherBusy(Exception):
+    """Черга перевірок паролів заповнена"""
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # За замовчуванням OpenSSL дозволяє scrypt лише 32 МіБ, тобто N <= 16384 при r = 8;
+    # scrypt потребує близько 128·r·(N + p + 2) байт — даємо стільки плюс 1 МіБ запасу
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem)
+
+
+def hash_password(password: str, salt: bytes | None = None) -> str:
+    """
+    Повертає рядок з алгоритмом, параметрами, сіллю та хешем,
+    щоб зміна вартості KDF не ламала перевірку вже збережених хешів.
+    """
+    salt = salt or os.urandom(16)
+    if KDF == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    if KDF == "pbkdf2_sha256":
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"unsupported KDF: {KDF}")
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """
+    Синхронна (CPU-важка) перевірка пароля проти збереженого хешу.
+    Пошкоджений або невідомий формат хешу — це просто невдалий логін, а не помилка.
+    """
+    algorithm, *params = encoded.split("$")
+    try:
+        if algorithm == "scrypt":
+            n, r, p, salt, expected = params
+            digest = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        elif algorithm == "pbkdf2_sha256":
+            iterations, salt, expected = params
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode(), base64.b64decode(salt), int(iterations))
+        else:
+            return False
+        return hmac.compare_digest(digest, base64.b64decode(expected))
+    except (ValueError, binascii.Error):
+        return False
+
+
+class PasswordHasher:
+    """Обмежений пул для перевірки паролів, щоб KDF не блокував цикл подій"""
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+
+    async def verify(self, password: str, encoded: str) -> bool:
+        # Лічильник змінюється лише з циклу подій, тому блокування не потрібне
+        if self.pending >= self.max_pending:
+            raise HasherBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, verify_password, password, encoded)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
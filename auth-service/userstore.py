@@ -0,0 +1,147 @@
+"""
+Компактне сховище користувачів: відсортована таблиця хешів email поверх вмісту файлу користувачів
+"""
+import logging
+import time
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import accumulate, islice, repeat
+from operator import itemgetter
+from typing import NamedTuple
+
+from filestore import FileStore, iter_chunks
+
+logger = logging.getLogger("uvicorn.error")
+
+HEADER = b"email,id,password_hash"
+
+
+class UserFileFormatError(ValueError):
+    """Файл користувачів має некоректний рядок"""
+
+
+class UserRecord(NamedTuple):
+    id: int
+    password_hash: str
+
+
+@dataclass(frozen=True)
+class LoadStats:
+    """Результат завантаження файлу користувачів"""
+    path: str
+    users: int
+    seconds: float
+
+
+def email_key(email: bytes) -> int:
+    """
+    64-бітний ключ email; колізії розв'язуються порівнянням самого email.
+    Вбудований hash() рандомізований між процесами, але таблиця живе лише
+    в процесі, що її побудував, тож стабільність між запусками не потрібна.
+    """
+    return hash(email)
+
+
+class UserTable:
+    """
+    Незмінний знімок користувачів.
+
+    Окрім самого вмісту файлу, на кожного користувача в пам'яті лише три числа
+    у масивах: ключ email, id та зсув його рядка. Email і хеш пароля вирізаються
+    з вмісту тільки під час пошуку (O(log n) бінарним пошуком по ключах).
+    Рядки файлу: `email,id,password_hash`, перший рядок може бути заголовком.
+    """
+
+    __slots__ = ("_data", "_keys", "_ids", "_offsets")
+
+    def __init__(self, data):
+        self._data = data
+        keys, ids, offsets = array("q"), array("q"), array("q")
+        for base, lines in iter_chunks(data):
+            # Зсув кожного рядка = зсув шматка + довжини попередніх рядків разом з "\n"
+            starts = list(accumulate(map((1).__add__, map(len, lines)), initial=base))
+            if b"" in lines or b"\r" in lines or lines[0].rstrip(b"\r") == HEADER:
+                kept = [
+                    (start, line)
+                    for start, line in zip(starts, lines)
+                    if line.strip() and line.rstrip(b"\r") != HEADER
+                ]
+                starts = [start for start, _ in kept]
+                lines = [line for _, line in kept]
+            # Увесь шматок розбирається через map — без Python-циклу на рядок
+            parts = list(map(bytes.split, lines, repeat(b","), repeat(2)))
+            try:
+                keys.extend(map(email_key, map(itemgetter(0), parts)))
+                ids.extend(map(int, map(itemgetter(1), parts)))
+            except (ValueError, IndexError) as e:
+                raise UserFileFormatError(f"bad row near #{len(ids) + 1}: {e}") from e
+            offsets.extend(islice(starts, len(lines)))
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = array("q", map(keys.__getitem__, order))
+        self._ids = array("q", map(ids.__getitem__, order))
+        self._offsets = array("q", map(offsets.__getitem__, order))
+
+    @classmethod
+    def from_records(cls, records: list[tuple[str, int, str]]) -> "UserTable":
+        """Таблиця з переліку (email, id, password_hash) — для вбудованих користувачів"""
+        lines = [f"{email},{uid},{password_hash}" for email, uid, password_hash in records]
+        return cls("\n".join(lines).encode())
+
+    @classmethod
+    def from_file(cls, path: str) -> "UserTable":
+        # Власна копія, а не mmap: файл, перезаписаний на місці, не зачепить таблицю,
+        # що вже обслуговує запити (відображення після обрізання файлу дало б SIGBUS)
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def nbytes(self) -> int:
+        """Розмір індексних масивів (без вмісту самого файлу)"""
+        return sum(a.itemsize * len(a) for a in (self._keys, self._ids, self._offsets))
+
+    def lookup(self, email: str) -> UserRecord | None:
+        """Користувач за email; при дублікатах у файлі — перший запис"""
+        raw = email.encode()
+        key = email_key(raw)
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i] == key:
+            start = self._offsets[i]
+            end = self._data.find(b"\n", start)
+            line = self._data[start:end if end != -1 else len(self._data)].rstrip(b"\r")
+            line_email, _, rest = line.partition(b",")
+            _, _, password_hash = rest.partition(b",")
+            if line_email == raw:
+                return UserRecord(self._ids[i], password_hash.decode())
+            i += 1
+        return None
+
+
+def load_file(path: str) -> tuple[UserTable, LoadStats]:
+    started = time.perf_counter()
+    table = UserTable.from_file(path)
+    return table, LoadStats(path, len(table), time.perf_counter() - started)
+
+
+class UserStore(FileStore):
+    """
+    Тримає поточну таблицю користувачів (див. FileStore).
+
+    Кожна таблиця тримає власну копію файлу, тож його можна переписувати на місці:
+    файл, прочитаний посеред запису, буде перечитаний, щойно зміниться його mtime.
+    """
+
+    what = "users"
+    format_error = UserFileFormatError
+    load_file = staticmethod(load_file)
+
+    async def load(self, path: str) -> LoadStats:
+        stats = await super().load(path)
+        logger.info(
+            "users loaded from %s: %d users in %.2fs (%d bytes of index)",
+            stats.path, stats.users, stats.seconds, self.current.nbytes,
+        )
+        return stats
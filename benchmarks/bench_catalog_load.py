@@ -0,0 +1,59 @@
+"""
+Бенчмарк завантаження каталогу з фіду постачальника.
+
+Генерує фід на N рядків (за замовчуванням 5M) і вимірює час побудови
+індексованого каталогу та швидкість у рядках за секунду.
+
+    python benchmarks/bench_catalog_load.py --rows 5000000 --format csv
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "product-service"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from catalog import load_file  # noqa: E402
+
+
+def write_feed(path: str, rows: int, fmt: str):
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "csv":
+            f.write("product_id,name,price,inStock\n")
+            for i in range(rows):
+                f.write(f"{i},Product {i} Keyboard,{i % 1000}.99,{i % 50}\n")
+        else:
+            for i in range(rows):
+                f.write(json.dumps({
+                    "product_id": i,
+                    "name": f"Product {i} Keyboard",
+                    "price": f"{i % 1000}.99",
+                    "inStock": i % 50,
+                }) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"feed.{args.format}")
+        started = time.perf_counter()
+        write_feed(path, args.rows, args.format)
+        print(f"generated {args.rows} rows in {time.perf_counter() - started:.2f}s "
+              f"({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+        catalog, stats = load_file(path)
+        assert len(catalog) == args.rows
+        assert catalog.get(args.rows - 1)["product_id"] == args.rows - 1
+        print(f"catalog_load format={args.format} rows={stats.rows} "
+              f"seconds={stats.seconds:.3f} rows_per_sec={stats.rows_per_sec:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Бенчмарк пошуку товарів за назвою на інвертованому індексі.
+
+Будує каталог на N товарів (за замовчуванням 1M) з назвами зі словника
+реалістичного розміру і вимірює затримку запитів (p50 / p99) для повних
+токенів, префіксів і запитів з кількох слів — як для помірно частих слів,
+так і для найчастіших термів та коротких префіксів (найгірший випадок).
+
+    python benchmarks/bench_product_search.py --products 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from itertools import accumulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "product-service"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from catalog import Catalog  # noqa: E402
+from search import QueryTooBroad, SearchIndex  # noqa: E402
+
+QUERIES = [
+    # помірно часті слова
+    "keyboard", "key", "wireless mouse", "wire mo", "usb c hub", "ergo", "monitor 27",
+    # найчастіші терми та короткі префікси
+    "w0", "w1", "w", "w0 w1", "w1 keyboard", "w0 w",
+]
+
+
+def make_catalog(n: int, vocabulary: int, seed: int = 42) -> Catalog:
+    rnd = random.Random(seed)
+    words = [f"w{i}" for i in range(vocabulary)]
+    # Розподіл слів нерівномірний, як у реальних назвах: w0, w1, ... — найчастіші,
+    # слова на кшталт "keyboard" — помірно часті
+    words[100:100] = ["keyboard", "mouse", "wireless", "usb", "c", "hub", "ergonomic", "monitor", "27"]
+    cum_weights = list(accumulate(1.0 / (i + 1) ** 0.5 for i in range(len(words))))
+    names = [" ".join(rnd.choices(words, cum_weights=cum_weights, k=rnd.randint(2, 5))) for _ in range(n)]
+    return Catalog(array("q", range(n)), names, ["9.99"] * n, array("q", [1]) * n)
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.products, args.vocabulary)
+    started = time.perf_counter()
+    index = SearchIndex.build(catalog)
+    print(f"index_build products={args.products} terms={len(index)} "
+          f"seconds={time.perf_counter() - started:.2f}")
+
+    for query in QUERIES:
+        timings = []
+        try:
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                result = index.search(query, limit=20)
+                timings.append((time.perf_counter() - t0) * 1000)
+        except QueryTooBroad as e:
+            print(f"search q={query!r:18} refused: {e}")
+            continue
+        print(f"search q={query!r:18} total={result.total:<7} exact={result.total_exact!s:5} "
+              f"p50_ms={percentile(timings, 0.5):.3f} p99_ms={percentile(timings, 0.99):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Бенчмарк сховища користувачів auth-service.
+
+Генерує файл на N користувачів (за замовчуванням 10M), завантажує його
+і звітує час завантаження, пам'ять на користувача та затримку пошуку.
+
+    python benchmarks/bench_user_store.py --users 10000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "auth-service"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "common"))
+
+from passwords import hash_password  # noqa: E402
+from userstore import load_file  # noqa: E402
+
+
+def rss_bytes() -> int:
+    """Поточний резидентний розмір процесу (Linux)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def write_users(path: str, users: int):
+    # Справжній KDF на мільйони рядків рахувався б годинами — хеш однаковий, сіль теж
+    password_hash = hash_password("password")
+    with open(path, "w", encoding="ascii") as f:
+        f.write("email,id,password_hash\n")
+        for i in range(users):
+            f.write(f"user{i}@example.com,{i},{password_hash}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.csv")
+        write_users(path, args.users)
+        print(f"generated {args.users} users ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+        rss_before = rss_bytes()
+        table, stats = load_file(path)
+        rss_after = rss_bytes()
+        print(f"user_store_load users={stats.users} seconds={stats.seconds:.2f} "
+              f"users_per_sec={stats.users / stats.seconds:.0f}")
+        print(f"user_store_memory index_bytes_per_user={table.nbytes / len(table):.1f} "
+              f"rss_bytes_per_user={(rss_after - rss_before) / len(table):.1f}")
+
+        emails = [f"user{random.randrange(args.users)}@example.com" for _ in range(args.lookups)]
+        started = time.perf_counter()
+        for email in emails:
+            assert table.lookup(email) is not None
+        elapsed = time.perf_counter() - started
+        print(f"user_store_lookup count={args.lookups} us_per_lookup={elapsed / args.lookups * 1e6:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Стиснення відповідей з узгодженням через Accept-Encoding: gzip, а також zstd / brotli, якщо встановлені.
+"""
+import asyncio
+import gzip
+import logging
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Менші тіла не стискаються: виграш менший за накладні витрати
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Більші тіла стискаються у пулі потоків, щоб не тримати цикл подій
+COMPRESSION_OFFLOAD_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "65536"))
+# Для ще більших тіл BodyCache бере DEFAULT_LEVELS: максимальні рівні на них стискали б хвилинами
+COMPRESSION_LARGE_SIZE = int(os.getenv("COMPRESSION_LARGE_SIZE", str(1024 * 1024)))
+# Скільки BodyCache чекає на стиснений варіант, перш ніж віддати тіло без стиснення
+COMPRESSION_WAIT_SECONDS = float(os.getenv("COMPRESSION_WAIT_SECONDS", "2"))
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+# Порядок переваги сервера при однаковому q від клієнта
+ENCODINGS = [
+    encoding
+    for encoding, available in (("zstd", zstandard), ("br", brotli), ("gzip", gzip))
+    if available is not None
+]
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """Найкраще доступне кодування з Accept-Encoding або None (без стиснення)"""
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_sync(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level)
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"unsupported encoding: {encoding}")
+
+
+async def compress(body: bytes, encoding: str, level: int) -> bytes:
+    if len(body) >= COMPRESSION_OFFLOAD_SIZE:
+        return await asyncio.to_thread(compress_sync, body, encoding, level)
+    return compress_sync(body, encoding, level)
+
+
+def vary_on_accept_encoding(headers: MutableHeaders):
+    """Додає Accept-Encoding до Vary, якщо його там ще немає"""
+    vary = {value.strip().lower() for value in headers.get("vary", "").split(",")}
+    if not vary & {"accept-encoding", "*"}:
+        headers.add_vary_header("Accept-Encoding")
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware: буферизує відповідь і стискає її узгодженим кодуванням.
+
+    `route_levels` — рівні стиснення для окремих шляхів, напр. {"/orders": {"gzip": 5}};
+    для решти кодувань і шляхів діють DEFAULT_LEVELS. Відповіді, що вже мають
+    Content-Encoding, передаються як є, а `skip_paths` — шляхи, що стискають
+    відповіді самі (BodyCache), — не стискаються ніколи.
+
+    Відповідь, яку стиснули б для іншого Accept-Encoding, отримує Vary: Accept-Encoding
+    і тоді, коли цей клієнт отримує її без стиснення.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        route_levels: dict | None = None,
+        skip_paths: set[str] | None = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.route_levels = route_levels or {}
+        self.skip_paths = skip_paths or set()
+
+    def _compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers or headers.get("content-type", "").startswith("text/event-stream"):
+            return False
+        length = headers.get("content-length")
+        return length is None or not length.isdigit() or int(length) >= self.minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            async def send_identity(message):
+                if message["type"] == "http.response.start" and self._compressible(Headers(raw=message["headers"])):
+                    vary_on_accept_encoding(MutableHeaders(scope=message))
+                await send(message)
+
+            await self.app(scope, receive, send_identity)
+            return
+
+        start_message = None
+        chunks: list[bytes] = []
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or headers.get("content-type", "").startswith("text/event-stream"):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            if len(body) >= self.minimum_size:
+                level = self.route_levels.get(scope["path"], {}).get(encoding, DEFAULT_LEVELS[encoding])
+                body = await compress(body, encoding, level)
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = encoding
+                vary_on_accept_encoding(headers)
+            MutableHeaders(scope=start_message)["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class BodyCache:
+    """
+    Тіло відповіді та його стиснені варіанти для незмінного джерела (напр. знімка каталогу).
+    Кеш скидається, щойно передано інше джерело.
+
+    Кожен варіант будується власним завданням один раз на джерело; запити того ж
+    кодування чекають на це завдання (не довше за `wait`), запити без стиснення
+    від нього не залежать. Якщо варіант не встиг або не зібрався, віддається тіло
+    без стиснення — шлях має бути в skip_paths CompressionMiddleware, щоб таку
+    відповідь не стискали заново на кожен запит.
+    """
+
+    def __init__(
+        self,
+        render,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        levels: dict | None = None,
+        large_size: int = COMPRESSION_LARGE_SIZE,
+        wait: float = COMPRESSION_WAIT_SECONDS,
+    ):
+        self._render = render
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.large_size = large_size
+        self.wait = wait
+        self._source = None
+        # кодування (None — без стиснення) -> завдання, що будує тіло
+        self._variants: dict[str | None, asyncio.Future] = {}
+
+    def _build(self, variants: dict, encoding: str | None, coro) -> asyncio.Future:
+        future = variants[encoding] = asyncio.ensure_future(coro)
+
+        def forget_failed(done: asyncio.Future):
+            # Невдалу спробу прибираємо, щоб наступний запит зібрав варіант знову
+            if done.cancelled() or done.exception() is not None:
+                if variants.get(encoding) is done:
+                    del variants[encoding]
+                if not done.cancelled():
+                    logger.warning("building %s body failed: %r", encoding or "identity", done.exception())
+
+        future.add_done_callback(forget_failed)
+        return future
+
+    async def get(self, source, encoding: str | None) -> tuple[bytes, str | None]:
+        """(тіло, фактичне кодування або None)"""
+        if source is not self._source:
+            self._source, self._variants = source, {}
+        variants = self._variants
+        rendering = variants.get(None) or self._build(variants, None, asyncio.to_thread(self._render, source))
+        # shield: відключення одного клієнта не скасовує спільний рендер
+        identity = await asyncio.shield(rendering)
+        if encoding is None or len(identity) < self.minimum_size:
+            return identity, None
+        compressing = variants.get(encoding)
+        if compressing is None:
+            levels = self.levels if len(identity) < self.large_size else DEFAULT_LEVELS
+            compressing = self._build(variants, encoding, compress(identity, encoding, levels[encoding]))
+        try:
+            return await asyncio.wait_for(asyncio.shield(compressing), self.wait), encoding
+        except Exception:
+            # Не встиг за `wait` або не зібрався (помилку вже записав forget_failed)
+            return identity, None
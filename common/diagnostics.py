@@ -0,0 +1,187 @@
+"""
+Діагностика: семплюючий профайлер на вимогу, монітор блокувань циклу подій та лічильники очікувань на інші сервіси.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+# Колбек, що тримає цикл подій довше за поріг, записується разом зі стеком
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+# Скільки останніх блокувань зберігати
+LOOP_LAG_HISTORY = int(os.getenv("LOOP_LAG_HISTORY", "100"))
+PROFILE_MAX_SECONDS = 60
+
+
+def collapse_stack(frame, root: str) -> str:
+    """Стек у форматі collapsed stacks (flamegraph.pl, speedscope): від кореня до листа через ";" """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}")
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names)).replace(" ", "_")
+
+
+class ProfilerBusy(Exception):
+    """Знімання профілю вже триває"""
+
+
+class SamplingProfiler:
+    """
+    Поки знімається профіль, окремий потік раз на `interval` читає стеки всіх потоків
+    процесу. Поза зніманням потоку немає, тож у простої профайлер нічого не коштує.
+    """
+
+    def __init__(self):
+        self.running = False
+
+    @staticmethod
+    def _sample(seconds: float, interval: float) -> Counter:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        counts: Counter = Counter()
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    counts[collapse_stack(frame, f"thread:{names.get(thread_id, thread_id)}")] += 1
+            time.sleep(interval)
+        return counts
+
+    async def capture(self, seconds: float, interval: float) -> str:
+        if self.running:
+            raise ProfilerBusy()
+        self.running = True
+        try:
+            counts = await asyncio.to_thread(self._sample, seconds, interval)
+        finally:
+            self.running = False
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items()))
+
+
+class LoopLagMonitor:
+    """
+    Корутина-серцебиття оновлює мітку часу кожні threshold/2; сторожовий потік,
+    помітивши, що мітка застаріла більше ніж на поріг, знімає стек потоку циклу
+    подій — це і є колбек, що його блокує. Тривалість фіксується, коли цикл оживає.
+    """
+
+    def __init__(self, threshold: float = LOOP_LAG_THRESHOLD_MS / 1000, history: int = LOOP_LAG_HISTORY):
+        self.threshold = threshold
+        self.stalls: deque[dict] = deque(maxlen=history)
+        self.total_stalls = 0
+        self._beat = time.monotonic()
+        self._stop = threading.Event()
+
+    async def run(self):
+        interval = self.threshold / 2
+        loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        watcher = threading.Thread(
+            target=self._watch, args=(loop_thread_id, interval), name="loop-lag-monitor", daemon=True,
+        )
+        watcher.start()
+        try:
+            while True:
+                self._beat = time.monotonic()
+                await asyncio.sleep(interval)
+        finally:
+            self._stop.set()
+
+    def _watch(self, loop_thread_id: int, interval: float):
+        stalled_beat = None
+        stack = None
+        while not self._stop.wait(interval):
+            beat = self._beat
+            if stalled_beat is not None and beat != stalled_beat:
+                # Цикл ожив: блокування тривало від очікуваного серцебиття до фактичного
+                self.stalls.append({
+                    "at": time.time() - (time.monotonic() - stalled_beat - interval),
+                    "duration_ms": round((beat - stalled_beat - interval) * 1000, 1),
+                    "stack": stack,
+                })
+                self.total_stalls += 1
+                stalled_beat = stack = None
+            if stalled_beat is None and time.monotonic() - beat > interval + self.threshold:
+                frame = sys._current_frames().get(loop_thread_id)
+                stalled_beat = beat
+                stack = collapse_stack(frame, "thread:event-loop") if frame is not None else None
+
+    def snapshot(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "total_stalls": self.total_stalls,
+            "stalls": list(self.stalls),
+        }
+
+
+class InflightCounter:
+    """Скільки корутин зараз чекає на кожен зовнішній сервіс (та пік з моменту старту)"""
+
+    def __init__(self):
+        self.current: Counter = Counter()
+        self.peak: Counter = Counter()
+
+    @contextmanager
+    def track(self, downstream: str):
+        self.current[downstream] += 1
+        self.peak[downstream] = max(self.peak[downstream], self.current[downstream])
+        try:
+            yield
+        finally:
+            self.current[downstream] -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            name: {"awaiting": self.current[name], "peak": self.peak[name]}
+            for name in self.peak
+        }
+
+
+class Diagnostics:
+    """Усе разом; монітор циклу працює завжди, адмін-маршрути підключаються за бажанням"""
+
+    def __init__(self):
+        self.profiler = SamplingProfiler()
+        self.loop_lag = LoopLagMonitor()
+        self.inflight = InflightCounter()
+        self._monitor_task: asyncio.Task | None = None
+
+    def start(self):
+        self._monitor_task = asyncio.create_task(self.loop_lag.run())
+
+    def stop(self):
+        if self._monitor_task:
+            self._monitor_task.cancel()
+
+    def router(self) -> APIRouter:
+        router = APIRouter(prefix="/admin")
+
+        @router.get("/profile", response_class=PlainTextResponse)
+        async def profile(
+            seconds: float = Query(default=5, gt=0, le=PROFILE_MAX_SECONDS),
+            interval_ms: float = Query(default=5, ge=1, le=1000),
+        ):
+            """Знімає профіль протягом `seconds` і повертає collapsed stacks для flamegraph"""
+            try:
+                return PlainTextResponse(await self.profiler.capture(seconds, interval_ms / 1000))
+            except ProfilerBusy:
+                return JSONResponse({"message": "profile capture already running"}, status_code=409)
+
+        @router.get("/loop-lag")
+        async def loop_lag():
+            return self.loop_lag.snapshot()
+
+        @router.get("/inflight")
+        async def inflight():
+            return self.inflight.snapshot()
+
+        return router
@@ -0,0 +1,92 @@
+"""
+Знімки даних із файлів: розбір вмісту шматками по межі рядка та сховище, що перечитує файл,
+щойно зміниться його mtime
+"""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger("uvicorn.error")
+
+# Розмір шматка файлу, який розбирається за один прохід
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def iter_chunks(data, start: int = 0, encoding: str | None = None, chunk_size: int = CHUNK_SIZE):
+    """
+    (зсув шматка, рядки шматка без "\\n") для bytes або mmap, починаючи зі `start`.
+    Шматки по `chunk_size` розрізаються лише по межі рядка; з `encoding` шматок
+    декодується цілим і рядки — str.
+    """
+    size = len(data)
+    newline = "\n" if encoding else b"\n"
+    while start < size:
+        end = min(start + chunk_size, size)
+        if end < size:
+            nl = data.rfind(b"\n", start, end)
+            if nl == -1:
+                # Рядок довший за шматок — дочитуємо до його кінця
+                nl = data.find(b"\n", end)
+                end = size if nl == -1 else nl + 1
+            else:
+                end = nl + 1
+        chunk = data[start:end]
+        lines = (chunk.decode(encoding) if encoding else chunk).split(newline)
+        if not lines[-1]:
+            lines.pop()
+        yield start, lines
+        start = end
+
+
+class FileStore:
+    """
+    Тримає поточний знімок (`current`), завантажений з файлу.
+
+    Новий знімок будується у потоці функцією `load_file(path) -> (знімок, статистика)`,
+    а підміна — одне присвоєння посилання, тому запити, що вже взяли `current`,
+    дочитують старий знімок без блокувань. Підкласи задають `load_file`, `what`
+    (назва для журналу) і `format_error` — помилку формату, про яку досить попередження.
+    """
+
+    what = "file"
+    format_error: type[Exception] = ValueError
+
+    def __init__(self, current):
+        self.current = current
+        self._lock = asyncio.Lock()
+        self._mtime: float | None = None
+        # mtime файлу, який не вдалося завантажити, — щоб не розбирати його знову на кожній перевірці
+        self._failed_mtime: float | None = None
+
+    @staticmethod
+    def load_file(path: str):
+        raise NotImplementedError
+
+    async def swapped(self, old, new):
+        """Викликається під замком після кожної підміни знімка"""
+
+    async def load(self, path: str):
+        async with self._lock:
+            mtime = os.stat(path).st_mtime
+            snapshot, stats = await asyncio.to_thread(self.load_file, path)
+            old, self.current = self.current, snapshot
+            self._mtime = mtime
+            await self.swapped(old, snapshot)
+        return stats
+
+    async def watch(self, path: str, interval: float):
+        """Періодично перевіряє mtime файлу й перезавантажує знімок, якщо файл змінився"""
+        while True:
+            await asyncio.sleep(interval)
+            mtime = None
+            try:
+                mtime = os.stat(path).st_mtime
+                if mtime not in (self._mtime, self._failed_mtime):
+                    await self.load(path)
+            except (OSError, self.format_error) as e:
+                self._failed_mtime = mtime
+                logger.warning("%s refresh from %s failed: %s", self.what, path, e)
+            except Exception:
+                # Перевірка не повинна зупинятися до кінця життя процесу через один поганий файл
+                self._failed_mtime = mtime
+                logger.exception("%s refresh from %s failed", self.what, path)
@@ -0,0 +1,94 @@
+"""
+Клієнт auth-service, що збирає паралельні перевірки токенів у один виклик /whoami:batch
+"""
+import asyncio
+
+import httpx
+
+
+class AuthUnavailable(Exception):
+    """auth-service недоступний або відповів не так, як очікувалось"""
+
+
+class WhoamiBatcher:
+    """
+    Перевірки, що надійшли протягом `window` секунд (або поки не набереться
+    `max_batch` токенів), відправляються одним запитом POST /whoami:batch.
+    Однакові токени в межах пакета перевіряються один раз. `max_batch` не має
+    перевищувати WHOAMI_BATCH_MAX в auth-service, інакше кожен пакет отримає 422.
+    """
+
+    def __init__(
+        self, auth_url: str, window: float, max_batch: int, transport: httpx.AsyncBaseTransport | None = None
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self._client = httpx.AsyncClient(base_url=auth_url, transport=transport)
+        self._pending: dict[str, list[asyncio.Future]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def whoami(self, authorization: str) -> dict:
+        """
+        identity ({"email": ...}) або {"error": ...} для одного значення Authorization;
+        AuthUnavailable, якщо auth-service не дав відповіді на пакет
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(authorization, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _post(self, tokens: list[str]) -> list[dict]:
+        """Результати /whoami:batch по одному на токен або AuthUnavailable"""
+        try:
+            response = await self._client.post("/whoami:batch", json={"tokens": tokens})
+        except httpx.HTTPError as e:
+            raise AuthUnavailable(f"/whoami:batch failed: {e!r}") from e
+        if response.status_code != 200:
+            raise AuthUnavailable(f"/whoami:batch returned {response.status_code}")
+        try:
+            results = response.json()["results"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise AuthUnavailable("/whoami:batch returned a malformed body") from e
+        if not isinstance(results, list):
+            raise AuthUnavailable("/whoami:batch returned a malformed body")
+        if len(results) != len(tokens):
+            # Без цієї перевірки zip мовчки залишив би частину запитів без відповіді
+            raise AuthUnavailable(f"/whoami:batch returned {len(results)} results for {len(tokens)} tokens")
+        return results
+
+    async def _send(self, batch: dict[str, list[asyncio.Future]]):
+        try:
+            results = await self._post(list(batch))
+        except Exception as e:
+            # Жоден очікувач пакета не має зависнути, хай що пішло не так
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for futures, result in zip(batch.values(), results):
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+
+    async def aclose(self):
+        self._flush()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        await self._client.aclose()
@@ -1,14 +1,62 @@
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Header
 from fastapi.responses import JSONResponse
-import httpx
 
-app = FastAPI(title="OrderService")
+from auth_client import AuthUnavailable, WhoamiBatcher
+from compression import CompressionMiddleware
+from diagnostics import Diagnostics
+from stats import OrderStats
 
 AUTH_URL = os.getenv("AUTH_URL", "http://localhost:8001")
 PRODUCT_URL = os.getenv("PRODUCT_URL", "http://localhost:8002")
+# Скільки мілісекунд накопичувати перевірки токенів перед одним /whoami:batch
+AUTH_BATCH_WINDOW_MS = float(os.getenv("AUTH_BATCH_WINDOW_MS", "2"))
+# Ліміт токенів в одному /whoami:batch з боку auth-service (та сама змінна, що й там);
+# більший пакет auth-service відхиляє з 422, тож AUTH_BATCH_MAX обрізається до нього
+WHOAMI_BATCH_MAX = int(os.getenv("WHOAMI_BATCH_MAX", "100"))
+AUTH_BATCH_MAX = min(int(os.getenv("AUTH_BATCH_MAX", "100")), WHOAMI_BATCH_MAX)
+# Скільки товарів і користувачів тримати в агрегатах /orders/stats
+ORDER_STATS_TOP_K = int(os.getenv("ORDER_STATS_TOP_K", "100"))
+# Розмір і кількість часових інтервалів у /orders/stats (за замовчуванням — остання доба по хвилині;
+# у відповіді лише інтервали, де були замовлення)
+ORDER_STATS_BUCKET_SECONDS = int(os.getenv("ORDER_STATS_BUCKET_SECONDS", "60"))
+ORDER_STATS_BUCKETS = int(os.getenv("ORDER_STATS_BUCKETS", "1440"))
+# Адмін-маршрути діагностики (/admin/profile, /admin/loop-lag, /admin/inflight)
+ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "0") == "1"
 
 ORDERS: list[dict] = []
+ORDER_STATS = OrderStats(ORDER_STATS_TOP_K, ORDER_STATS_BUCKET_SECONDS, ORDER_STATS_BUCKETS)
+
+AUTH = WhoamiBatcher(AUTH_URL, AUTH_BATCH_WINDOW_MS / 1000, AUTH_BATCH_MAX)
+DIAGNOSTICS = Diagnostics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    DIAGNOSTICS.start()
+    yield
+    DIAGNOSTICS.stop()
+    await AUTH.aclose()
+
+
+app = FastAPI(title="OrderService", lifespan=lifespan)
+# Список замовлень змінюється з кожним замовленням і стискається щоразу — рівні помірні
+app.add_middleware(CompressionMiddleware, route_levels={"/orders": {"gzip": 4, "br": 3, "zstd": 1}})
+if ADMIN_ENABLED:
+    app.include_router(DIAGNOSTICS.router())
+
+
+def validate_order(payload: dict) -> str | None:
+    """Опис помилки або None; існування товару та запаси тут не перевіряються"""
+    product_id = payload.get("productId")
+    if isinstance(product_id, bool) or not isinstance(product_id, (int, str)):
+        return "productId must be an integer or a string"
+    qty = payload.get("qty")
+    if isinstance(qty, bool) or not isinstance(qty, int) or qty <= 0:
+        return "qty must be a positive integer"
+    return None
 
 
 @app.post("/orders")
@@ -16,16 +64,31 @@ async def create_order(payload: dict, authorization: str | None = Header(default
     """
     Очікуваний payload: {"productId": int, "qty": int}
     """
-    # (Намагаємось) перевірити токен
-    async with httpx.AsyncClient() as client:
-        _ = await client.get(f"{AUTH_URL}/whoami", headers={"Authorization": authorization or ""})
+    error = validate_order(payload)
+    if error:
+        return JSONResponse({"message": error}, status_code=422)
+
+    # (Намагаємось) перевірити токен; перевірки паралельних запитів йдуть одним /whoami:batch.
+    # Невалідний токен дає user_email None (замовлення все одно створюється), а недоступний
+    # auth-service — 503: без відповіді не відрізнити невалідний токен від валідного
+    try:
+        with DIAGNOSTICS.inflight.track("auth-service"):
+            identity = await AUTH.whoami(authorization or "")
+    except AuthUnavailable:
+        return JSONResponse(
+            {"message": "auth service unavailable, try again later"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
 
     order = {
         "order_id": len(ORDERS) + 1,
         "product_id": payload.get("productId"),
         "quantity": payload.get("qty"),
         "status": "created",
+        "user_email": identity.get("email"),
     }
+    ORDER_STATS.record(order)
     ORDERS.append(order)
     return JSONResponse(order, status_code=201)
 
@@ -33,3 +96,9 @@ async def create_order(payload: dict, authorization: str | None = Header(default
 @app.get("/orders")
 async def list_orders():
     return {"orders": ORDERS}
+
+
+@app.get("/orders/stats")
+async def order_stats():
+    """Агрегати підтримуються в create_order, тому відповідь не залежить від кількості замовлень"""
+    return ORDER_STATS.snapshot()
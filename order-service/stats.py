@@ -0,0 +1,122 @@
+"""
+Агрегати замовлень, що оновлюються при кожному новому замовленні (без сканування ORDERS)
+"""
+import time
+
+
+class TopK:
+    """
+    Space-Saving: тримає не більше `capacity` ключів з найбільшою кількістю замовлень.
+
+    Коли місця немає, ключ з найменшим лічильником витісняється, а новий ключ
+    успадковує його лічильник як похибку: `orders` — оцінка зверху,
+    `orders - error` — гарантована нижня межа. `quantity` рахується з моменту,
+    коли ключ потрапив у таблицю.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # ключ -> [orders, quantity, error]
+        self._counters: dict = {}
+
+    def add(self, key, quantity: int):
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += 1
+            counter[1] += quantity
+            return
+        if len(self._counters) < self.capacity:
+            self._counters[key] = [1, quantity, 0]
+            return
+        victim = min(self._counters, key=lambda k: self._counters[k][0])
+        floor = self._counters.pop(victim)[0]
+        self._counters[key] = [floor + 1, quantity, floor]
+
+    def top(self, key_name: str) -> list[dict]:
+        ranked = sorted(self._counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [
+            {key_name: key, "orders": orders, "quantity": quantity, "orders_error": error}
+            for key, (orders, quantity, error) in ranked
+        ]
+
+
+class TimeBuckets:
+    """
+    Кільце з `buckets` інтервалів по `bucket_seconds` секунд: інтервал потрапляє
+    у комірку за своїм номером (start // bucket_seconds % buckets), тож хвилини без
+    замовлень не зсувають вікно, а запізнілі замовлення потрапляють у свій інтервал.
+    """
+
+    def __init__(self, bucket_seconds: int, buckets: int):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        # [початок інтервалу (unix time), orders, quantity] або None для порожньої комірки
+        self._ring: list[list[int] | None] = [None] * buckets
+
+    def bucket_start(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds) * self.bucket_seconds
+
+    def add(self, timestamp: float, quantity: int):
+        start = self.bucket_start(timestamp)
+        slot = start // self.bucket_seconds % self.buckets
+        bucket = self._ring[slot]
+        if bucket is None or bucket[0] < start:
+            bucket = self._ring[slot] = [start, 0, 0]
+        elif bucket[0] > start:
+            # Замовлення старіше за все вікно — його інтервал уже витіснено
+            return
+        bucket[1] += 1
+        bucket[2] += quantity
+
+    def series(self, now: float) -> list[dict]:
+        """Непорожні інтервали останніх `buckets` інтервалів до `now`, від старших до новіших"""
+        end = self.bucket_start(now)
+        first = end - (self.buckets - 1) * self.bucket_seconds
+        return [
+            {"start": start, "orders": orders, "quantity": quantity}
+            for start, orders, quantity in sorted(filter(None, self._ring))
+            if first <= start <= end
+        ]
+
+
+class OrderStats:
+    """Підсумки по всіх замовленнях, топ товарів і користувачів та ряд за часом"""
+
+    def __init__(self, top_k: int, bucket_seconds: int, buckets: int):
+        self.orders = 0
+        self.quantity = 0
+        self.by_product = TopK(top_k)
+        self.by_user = TopK(top_k)
+        self.by_time = TimeBuckets(bucket_seconds, buckets)
+        self._snapshot: dict | None = None
+        self._snapshot_bucket: int | None = None
+
+    def record(self, order: dict, timestamp: float | None = None):
+        """Замовлення вже перевірене в create_order: product_id — скаляр, quantity — додатне ціле"""
+        quantity = order["quantity"]
+        self.orders += 1
+        self.quantity += quantity
+        self.by_product.add(order["product_id"], quantity)
+        if order.get("user_email") is not None:
+            self.by_user.add(order["user_email"], quantity)
+        self.by_time.add(time.time() if timestamp is None else timestamp, quantity)
+        self._snapshot = None
+
+    def snapshot(self) -> dict:
+        """
+        Знімок кешується до наступного замовлення або до початку нового інтервалу;
+        його розмір обмежений top_k і buckets
+        """
+        now = time.time()
+        bucket = self.by_time.bucket_start(now)
+        if self._snapshot is None or self._snapshot_bucket != bucket:
+            self._snapshot = {
+                "orders": self.orders,
+                "quantity": self.quantity,
+                "by_product": self.by_product.top("product_id"),
+                "by_user": self.by_user.top("user_email"),
+                "by_time": self.by_time.series(now),
+                "bucket_seconds": self.by_time.bucket_seconds,
+            }
+            self._snapshot_bucket = bucket
+        return self._snapshot
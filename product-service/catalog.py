@@ -0,0 +1,218 @@
+"""
+Каталог товарів у колонковому вигляді та потокове завантаження фідів постачальників (CSV / JSONL)
+"""
+import csv
+import json
+import logging
+import mmap
+import os
+import time
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from operator import itemgetter
+
+from filestore import FileStore, iter_chunks
+
+logger = logging.getLogger("uvicorn.error")
+
+FIELDS = ("product_id", "name", "price", "inStock")
+
+
+class CatalogFormatError(ValueError):
+    """Фід має невідомий формат, не містить потрібних колонок або має некоректний рядок"""
+
+
+@dataclass(frozen=True)
+class LoadStats:
+    """Результат завантаження фіду"""
+    path: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float("inf")
+
+
+class Catalog:
+    """
+    Незмінний знімок каталогу.
+
+    Товари зберігаються колонками (масиви замість dict на кожен товар),
+    а словник товару збирається лише тоді, коли його треба віддати клієнту.
+    Пошук за product_id — бінарний пошук по відсортованому масиву ключів.
+    """
+
+    __slots__ = ("ids", "names", "prices", "in_stock", "_keys", "_rows")
+
+    def __init__(self, ids: array, names: list, prices: list, in_stock: array):
+        if not (len(ids) == len(names) == len(prices) == len(in_stock)):
+            raise CatalogFormatError("columns have different lengths")
+        self.ids = ids
+        self.names = names
+        self.prices = prices
+        self.in_stock = in_stock
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        self._keys = array("q", map(ids.__getitem__, order))
+        self._rows = array("q", order)
+
+    @classmethod
+    def from_products(cls, products: list[dict]) -> "Catalog":
+        """Будує знімок зі списку словників (вбудований каталог)"""
+        return cls(
+            array("q", (p["product_id"] for p in products)),
+            [p["name"] for p in products],
+            [p["price"] for p in products],
+            array("q", (p["inStock"] for p in products)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, i: int) -> dict:
+        return {
+            "product_id": self.ids[i],
+            "name": self.names[i],
+            "price": self.prices[i],
+            "inStock": self.in_stock[i],
+        }
+
+    def get(self, pid: int) -> dict | None:
+        """Товар за product_id; при дублікатах у фіді — перший запис"""
+        i = bisect_left(self._keys, pid)
+        if i < len(self._keys) and self._keys[i] == pid:
+            return self.row(self._rows[i])
+        return None
+
+    def name(self, pid: int) -> str | None:
+        """Назва товару за product_id — без збирання словника товару"""
+        i = bisect_left(self._keys, pid)
+        if i < len(self._keys) and self._keys[i] == pid:
+            return self.names[self._rows[i]]
+        return None
+
+    def items(self) -> list[dict]:
+        """Усі товари у порядку фіду"""
+        return [self.row(i) for i in range(len(self.ids))]
+
+
+def _iter_chunks(path: str):
+    """
+    Читає файл через mmap шматками по межі рядка (див. filestore.iter_chunks).
+    Повертає списки рядків (без символу переводу рядка).
+    Поля CSV з переводом рядка всередині лапок не підтримуються.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 3 if mm[:3] == b"\xef\xbb\xbf" else 0
+            for _, lines in iter_chunks(mm, start, encoding="utf-8"):
+                yield lines
+
+
+def _column_getters(header: list[str]):
+    missing = [name for name in FIELDS if name not in header]
+    if missing:
+        raise CatalogFormatError(f"missing columns: {', '.join(missing)}")
+    return [itemgetter(header.index(name)) for name in FIELDS]
+
+
+def _load_csv(path: str):
+    ids, names, prices, in_stock = array("q"), [], [], array("q")
+    getters = None
+    for lines in _iter_chunks(path):
+        reader = csv.reader(lines)
+        if getters is None:
+            header = next(reader, None)
+            if header is None:
+                continue
+            getters = _column_getters([h.strip() for h in header])
+        rows = list(filter(None, reader))
+        get_id, get_name, get_price, get_stock = getters
+        try:
+            # Колонки заповнюються пачкою через map — без dict на кожен рядок
+            ids.extend(map(int, map(get_id, rows)))
+            names.extend(map(get_name, rows))
+            prices.extend(map(get_price, rows))
+            in_stock.extend(map(int, map(get_stock, rows)))
+        except (ValueError, IndexError) as e:
+            raise CatalogFormatError(f"{path}: bad row near #{len(ids) + 1}: {e}") from e
+    if getters is None:
+        raise CatalogFormatError(f"{path}: empty feed")
+    return ids, names, prices, in_stock
+
+
+def _load_jsonl(path: str):
+    ids, names, prices, in_stock = array("q"), [], [], array("q")
+    getters = [itemgetter(name) for name in FIELDS]
+    for lines in _iter_chunks(path):
+        # Один виклик json.loads на весь шматок замість виклику на кожен рядок
+        try:
+            objs = json.loads("[" + ",".join(line for line in lines if line.strip()) + "]")
+        except json.JSONDecodeError as e:
+            raise CatalogFormatError(f"{path}: bad JSON near row #{len(ids) + 1}: {e}") from e
+        get_id, get_name, get_price, get_stock = getters
+        try:
+            ids.extend(map(int, map(get_id, objs)))
+            names.extend(map(get_name, objs))
+            prices.extend(map(get_price, objs))
+            in_stock.extend(map(int, map(get_stock, objs)))
+        except (KeyError, TypeError, ValueError) as e:
+            raise CatalogFormatError(f"{path}: bad row near #{len(ids) + 1}: {e}") from e
+    return ids, names, prices, in_stock
+
+
+LOADERS = {
+    ".csv": _load_csv,
+    ".jsonl": _load_jsonl,
+    ".ndjson": _load_jsonl,
+}
+
+
+def load_file(path: str) -> tuple[Catalog, LoadStats]:
+    """Завантажує фід (формат визначається розширенням) та будує індексований знімок"""
+    loader = LOADERS.get(os.path.splitext(path)[1].lower())
+    if loader is None:
+        raise CatalogFormatError(f"unsupported feed format: {path}")
+    started = time.perf_counter()
+    try:
+        columns = loader(path)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise CatalogFormatError(f"{path}: {e}") from e
+    catalog = Catalog(*columns)
+    return catalog, LoadStats(path, len(catalog), time.perf_counter() - started)
+
+
+class CatalogStore(FileStore):
+    """
+    Тримає поточний знімок каталогу (див. FileStore).
+    Слухачі (async fn(old, new)) викликаються після кожної підміни по черзі.
+    """
+
+    what = "catalog"
+    format_error = CatalogFormatError
+    load_file = staticmethod(load_file)
+
+    def __init__(self, catalog: Catalog):
+        super().__init__(catalog)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    async def swapped(self, old: Catalog, new: Catalog):
+        for listener in self._listeners:
+            try:
+                await listener(old, new)
+            except Exception:
+                logger.exception("catalog listener %r failed", listener)
+
+    async def load(self, path: str) -> LoadStats:
+        stats = await super().load(path)
+        logger.info(
+            "catalog loaded from %s: %d rows in %.2fs (%.0f rows/s)",
+            stats.path, stats.rows, stats.seconds, stats.rows_per_sec,
+        )
+        return stats
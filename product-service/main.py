@@ -1,7 +1,21 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.responses import JSONResponse
 
-app = FastAPI(title="ProductService")
+from catalog import Catalog, CatalogStore
+from compression import BodyCache, CompressionMiddleware, negotiate
+from diagnostics import Diagnostics
+from search import ProductSearch, QueryTooBroad
+
+# Фід постачальника (CSV або JSONL); без нього працює вбудований каталог
+CATALOG_PATH = os.getenv("CATALOG_PATH")
+# Як часто перевіряти, чи змінився фід (0 — не перевіряти)
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "0"))
+# Адмін-маршрути діагностики (/admin/profile, /admin/loop-lag, /admin/inflight)
+ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "0") == "1"
 
 # Нехай у нас є простий каталог товарів
 PRODUCTS = [
@@ -9,15 +23,82 @@ PRODUCTS = [
     {"product_id": 101, "name": "Mouse", "price": "29.99", "inStock": 0},
 ]
 
+CATALOG = CatalogStore(Catalog.from_products(PRODUCTS))
+SEARCH = ProductSearch(CATALOG.current)
+CATALOG.add_listener(SEARCH.on_catalog_swap)
+
+
+def render_listing(catalog: Catalog) -> bytes:
+    return JSONResponse({"items": catalog.items()}).body
+
+
+# Список товарів і його стиснені варіанти рахуються один раз на знімок каталогу, тому рівні
+# вищі за типові; CompressionMiddleware цей шлях не стискає (див. skip_paths)
+LISTING = BodyCache(render_listing, levels={"gzip": 9, "br": 9, "zstd": 12})
+
+DIAGNOSTICS = Diagnostics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    DIAGNOSTICS.start()
+    refresher = None
+    if CATALOG_PATH:
+        await CATALOG.load(CATALOG_PATH)
+        if CATALOG_REFRESH_SECONDS > 0:
+            refresher = asyncio.create_task(CATALOG.watch(CATALOG_PATH, CATALOG_REFRESH_SECONDS))
+    yield
+    if refresher:
+        refresher.cancel()
+    DIAGNOSTICS.stop()
+
+
+app = FastAPI(title="ProductService", lifespan=lifespan)
+app.add_middleware(CompressionMiddleware, skip_paths={"/products"})
+if ADMIN_ENABLED:
+    app.include_router(DIAGNOSTICS.router())
+
 
 @app.get("/products")
-async def list_products():
-    return {"items": PRODUCTS}
+async def list_products(request: Request):
+    body, encoding = await LISTING.get(CATALOG.current, negotiate(request.headers.get("accept-encoding")))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/products/search")
+async def search_products(
+    q: str,
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=10_000),
+):
+    """
+    Пошук за назвою: токени запиту збігаються з токенами назви повністю або як префікс.
+    Для дуже частих термів total_exact = false: total — оцінка (див. SearchIndex.search).
+    Надто загальний запит (напр. префікс з однієї літери) отримує 400.
+    Маршрут оголошено до /products/{pid}, інакше "search" розбирався б як pid.
+    """
+    catalog = CATALOG.current
+    try:
+        result = SEARCH.index.search(q, limit, offset)
+    except QueryTooBroad as e:
+        return JSONResponse({"message": f"query too broad: {e}; use longer prefixes or more words"}, status_code=400)
+    # Індекс може на мить відставати від щойно підміненого знімка
+    items = [p for p in map(catalog.get, result.pids) if p is not None]
+    return {
+        "items": items,
+        "total": result.total,
+        "total_exact": result.total_exact,
+        "limit": limit,
+        "offset": offset,
+    }
 
 
 @app.get("/products/{pid}")
 async def get_product(pid: int):
-    for p in PRODUCTS:
-        if p["product_id"] == pid:
-            return p
+    product = CATALOG.current.get(pid)
+    if product is not None:
+        return product
     return JSONResponse({"message": "not found"}, status_code=200)
@@ -0,0 +1,326 @@
+"""
+Інвертований індекс назв товарів для пошуку за токенами та префіксами
+"""
+import asyncio
+import heapq
+import math
+import re
+from array import array
+from collections import Counter
+from bisect import bisect_left, bisect_right, insort
+from itertools import groupby, islice
+from typing import NamedTuple
+
+from catalog import Catalog
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Вага збігу: повний токен важить більше, ніж префікс
+EXACT_WEIGHT = 2
+PREFIX_WEIGHT = 1
+# Скільки термів словника максимум розгортається для одного префікса
+MAX_PREFIX_TERMS = 256
+# До скількох входжень запит з кількох токенів перетинається словниками цілком
+MAX_CANDIDATES = 4000
+# Скільки кандидатів максимум перевіряється за назвою, доки сторінку не доведено
+MAX_SCAN = 10_000
+# Якщо змінилась більша частка каталогу, індекс дешевше перебудувати з нуля
+REBUILD_RATIO = 0.25
+# Скільки змін застосовується до індексу між поверненнями керування циклу подій
+APPLY_BATCH = 1000
+
+
+EMPTY = array("q")
+
+
+class SearchResult(NamedTuple):
+    total: int
+    pids: list[int]
+    # False — total є оцінкою; сторінка при цьому завжди точна
+    total_exact: bool
+
+
+class QueryTooBroad(ValueError):
+    """Сторінку не можна довести в межах обмежень: префікс або слова запиту надто загальні"""
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Токен -> відсортований array('q') з product_id (компактний список входжень).
+    Поруч тримається відсортований словник термів для префіксного пошуку
+    та знімок каталогу, за назвами якого перевіряються кандидати широких запитів.
+    """
+
+    def __init__(self, catalog: Catalog | None = None):
+        self._postings: dict[str, array] = {}
+        self._terms: list[str] = []
+        self.catalog = catalog
+
+    @classmethod
+    def build(cls, catalog: Catalog) -> "SearchIndex":
+        postings: dict[str, list[int]] = {}
+        for pid, name in zip(catalog.ids, catalog.names):
+            for term in set(tokenize(name)):
+                postings.setdefault(term, []).append(pid)
+        index = cls(catalog)
+        index._postings = {term: array("q", sorted(set(pids))) for term, pids in postings.items()}
+        index._terms = sorted(index._postings)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def add(self, pid: int, name: str):
+        for term in set(tokenize(name)):
+            posting = self._postings.get(term)
+            if posting is None:
+                self._postings[term] = array("q", (pid,))
+                insort(self._terms, term)
+                continue
+            i = bisect_left(posting, pid)
+            if i == len(posting) or posting[i] != pid:
+                posting.insert(i, pid)
+
+    def remove(self, pid: int, name: str):
+        for term in set(tokenize(name)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            i = bisect_left(posting, pid)
+            if i < len(posting) and posting[i] == pid:
+                del posting[i]
+            if not posting:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+
+    def _expand(self, token: str) -> tuple[array, list[array], bool]:
+        """
+        (входження повного токена, входження термів з цим префіксом, чи обрізано розгортання).
+        Розгортається не більше MAX_PREFIX_TERMS термів — решта позначається як обрізана.
+        """
+        exact = self._postings.get(token, EMPTY)
+        prefixes = []
+        i = bisect_left(self._terms, token)
+        if i < len(self._terms) and self._terms[i] == token:
+            i += 1
+        while i < len(self._terms) and self._terms[i].startswith(token):
+            if len(prefixes) == MAX_PREFIX_TERMS:
+                return exact, prefixes, True
+            prefixes.append(self._postings[self._terms[i]])
+            i += 1
+        return exact, prefixes, False
+
+    def _estimate_prefix_postings(self, token: str) -> int:
+        """
+        Оцінка сумарної кількості входжень усіх термів, що починаються з token
+        (крім самого token): MAX_PREFIX_TERMS термів, рівномірно взятих з усього діапазону
+        """
+        start = bisect_right(self._terms, token)
+        count = bisect_left(self._terms, token + "\U0010ffff", start) - start
+        sample = [
+            len(self._postings[self._terms[start + i * count // MAX_PREFIX_TERMS]])
+            for i in range(MAX_PREFIX_TERMS)
+        ]
+        return sum(sample) * count // MAX_PREFIX_TERMS
+
+    def search(self, query: str, limit: int, offset: int = 0) -> SearchResult:
+        """
+        Кожен токен запиту має збігтися з токеном назви повністю або як префікс;
+        ранжування — за сумою ваг, далі за product_id.
+
+        Сторінка завжди точна. Для одного токена вона береться зрізом повних збігів
+        і злиттям префіксних входжень за product_id. Кілька токенів перетинаються
+        словниками, якщо входжень не більше MAX_CANDIDATES; інакше кандидати
+        найкоротшого повністю розгорнутого токена перевіряються за назвою, доки
+        сторінку не доведено (див. _search_tokens). Якщо перебір зупинено раніше,
+        `total_exact` = False і total — оцінка. Коли довести сторінку в межах
+        MAX_PREFIX_TERMS / MAX_SCAN не вдається, піднімається QueryTooBroad.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return SearchResult(0, [], True)
+        expanded = [self._expand(token) for token in tokens]
+        if len(tokens) == 1:
+            return self._search_token(tokens[0], expanded[0], limit, offset)
+        return self._search_tokens(tokens, expanded, limit, offset)
+
+    def _search_token(
+        self, token: str, expanded: tuple[array, list[array], bool], limit: int, offset: int,
+    ) -> SearchResult:
+        exact, prefixes, truncated = expanded
+        if truncated and len(exact) < offset + limit:
+            # Префіксні збіги не розгорнуто повністю — довести сторінку за ними неможливо
+            raise QueryTooBroad("prefix matches too many terms")
+        # Повні збіги важать більше й уже відсортовані за product_id — сторінка з них це зріз
+        page = list(exact[offset:offset + limit])
+        if len(page) < limit and prefixes:
+            skip = max(0, offset - len(exact))
+            prefix_only = (
+                pid for pid, _ in groupby(heapq.merge(*prefixes))
+                if not _contains(exact, pid)
+            )
+            page.extend(islice(prefix_only, skip, skip + limit - len(page)))
+        prefix_size = sum(map(len, prefixes))
+        if truncated:
+            postings = len(exact) + self._estimate_prefix_postings(token)
+            if not self.catalog:
+                return SearchResult(postings, page, False)
+            # Товар з кількома термами префікса має кілька входжень; вважаючи терми
+            # незалежними, очікувана кількість різних товарів — N·(1 − e^(−входження/N))
+            size = len(self.catalog)
+            return SearchResult(round(size * -math.expm1(-postings / size)), page, False)
+        if not prefix_size:
+            return SearchResult(len(exact), page, True)
+        if len(exact) + prefix_size <= MAX_CANDIDATES:
+            return SearchResult(len(set(exact).union(*prefixes)), page, True)
+        # Товар з кількома термами одного префікса порахується кілька разів
+        return SearchResult(len(exact) + prefix_size, page, False)
+
+    def _search_tokens(
+        self, tokens: list[str], expanded: list[tuple[array, list[array], bool]], limit: int, offset: int,
+    ) -> SearchResult:
+        sizes = list(map(_expanded_size, expanded))
+        if not any(t for _, _, t in expanded) and sum(sizes) <= MAX_CANDIDATES:
+            return self._intersect(expanded, limit, offset)
+
+        complete = [i for i, (_, _, truncated) in enumerate(expanded) if not truncated]
+        if not complete or self.catalog is None:
+            raise QueryTooBroad("every query token matches too many terms")
+        lead = min(complete, key=sizes.__getitem__)
+        lead_exact, lead_prefixes, _ = expanded[lead]
+        need = offset + limit
+
+        # Кожен збіг містить збіг найкоротшого токена, тож його кандидатів досить.
+        # Перевіряємо їх за назвою за зростанням product_id, доки не знайдено need збігів
+        scores: dict[int, int] = {}
+        checked = 0
+        candidates = (pid for pid, _ in groupby(heapq.merge(lead_exact, *lead_prefixes)))
+        for pid in candidates:
+            checked += 1
+            if checked > MAX_SCAN:
+                raise QueryTooBroad("query words are too frequent")
+            score = self._score(pid, tokens)
+            if score is not None:
+                scores[pid] = score
+                if len(scores) == need:
+                    break
+        else:
+            return SearchResult(len(scores), _rank(scores, limit, offset), True)
+        walked, found, last = checked, len(scores), pid
+
+        # Наступні кандидати мають більші product_id, тож знайдені збіги випередить лише
+        # товар з більшою вагою, ніж найслабший з них. Вага не більша за PREFIX_WEIGHT
+        # на токен плюс різниця ваг за кожен повний збіг, тому такий товар мусить бути
+        # у списках повних входжень щонайменше `required` токенів — вони завжди повні
+        weakest = min(scores.values())
+        required = (weakest - PREFIX_WEIGHT * len(tokens)) // (EXACT_WEIGHT - PREFIX_WEIGHT) + 1
+        if required <= sum(1 for exact, _, _ in expanded if exact):
+            counts: Counter = Counter()
+            for exact, _, _ in expanded:
+                counts.update(exact[bisect_right(exact, last):])
+            for pid in sorted(pid for pid, count in counts.items() if count >= required):
+                checked += 1
+                if checked > MAX_SCAN:
+                    raise QueryTooBroad("query words are too frequent")
+                score = self._score(pid, tokens)
+                if score is not None and score > weakest:
+                    scores[pid] = score
+
+        # Частку збігів серед переглянутих кандидатів переносимо на решту
+        estimate = round(found * sizes[lead] / walked)
+        return SearchResult(max(estimate, len(scores)), _rank(scores, limit, offset), False)
+
+    def _intersect(self, expanded: list[tuple[array, list[array], bool]], limit: int, offset: int) -> SearchResult:
+        """Точний перетин словниками на рівні C, від найкоротшого токена"""
+        expanded = sorted(expanded, key=_expanded_size)
+        scores = _weights(expanded[0])
+        for other in expanded[1:]:
+            if not scores:
+                break
+            weights = _weights(other)
+            scores = {pid: s + weights[pid] for pid, s in scores.items() if pid in weights}
+        return SearchResult(len(scores), _rank(scores, limit, offset), True)
+
+    def _score(self, pid: int, tokens: list[str]) -> int | None:
+        """Вага товару для запиту за його поточною назвою або None, якщо він не збігається"""
+        name = self.catalog.name(pid)
+        if name is None:
+            return None
+        terms = tokenize(name)
+        score = 0
+        for token in tokens:
+            if token in terms:
+                score += EXACT_WEIGHT
+            elif any(term.startswith(token) for term in terms):
+                score += PREFIX_WEIGHT
+            else:
+                return None
+        return score
+
+
+def _rank(scores: dict[int, int], limit: int, offset: int) -> list[int]:
+    ranked = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+    return [pid for pid, _ in ranked[offset:]]
+
+
+def _expanded_size(expanded: tuple[array, list[array], bool]) -> int:
+    exact, prefixes, _ = expanded
+    return len(exact) + sum(map(len, prefixes))
+
+
+def _weights(expanded: tuple[array, list[array], bool]) -> dict[int, int]:
+    """product_id -> вага збігу токена (словник будується на рівні C)"""
+    exact, prefixes, _ = expanded
+    weights: dict[int, int] = {}
+    for posting in prefixes:
+        weights.update(dict.fromkeys(posting, PREFIX_WEIGHT))
+    weights.update(dict.fromkeys(exact, EXACT_WEIGHT))
+    return weights
+
+
+def _contains(posting: array, pid: int) -> bool:
+    i = bisect_left(posting, pid)
+    return i < len(posting) and posting[i] == pid
+
+
+def diff_catalogs(old: Catalog, new: Catalog) -> list[tuple[int, str | None, str | None]]:
+    """Зміни назв між знімками: (product_id, стара назва або None, нова назва або None)"""
+    # reversed — щоб при дублікатах залишався перший запис, як у Catalog.get
+    old_names = dict(zip(reversed(old.ids), reversed(old.names)))
+    new_names = dict(zip(reversed(new.ids), reversed(new.names)))
+    changes = [
+        (pid, old_names.get(pid), name)
+        for pid, name in new_names.items()
+        if old_names.get(pid) != name
+    ]
+    changes.extend((pid, name, None) for pid, name in old_names.items() if pid not in new_names)
+    return changes
+
+
+class ProductSearch:
+    """Тримає індекс поточного каталогу та оновлює його при підміні знімка"""
+
+    def __init__(self, catalog: Catalog):
+        self.index = SearchIndex.build(catalog)
+
+    async def on_catalog_swap(self, old: Catalog, new: Catalog):
+        changes = await asyncio.to_thread(diff_catalogs, old, new)
+        if len(changes) > len(new) * REBUILD_RATIO:
+            self.index = await asyncio.to_thread(SearchIndex.build, new)
+            return
+        # Невелику кількість змін застосовуємо на місці, порціями,
+        # щоб не тримати цикл подій під час великого оновлення;
+        # кандидати вже перевіряються за назвами нового знімка
+        index = self.index
+        index.catalog = new
+        for start in range(0, len(changes), APPLY_BATCH):
+            for pid, old_name, new_name in changes[start:start + APPLY_BATCH]:
+                if old_name is not None:
+                    index.remove(pid, old_name)
+                if new_name is not None:
+                    index.add(pid, new_name)
+            await asyncio.sleep(0)
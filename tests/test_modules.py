@@ -0,0 +1,852 @@
+"""
+Тести модулів сервісів без запущених контейнерів (завантаження фідів, пошук, сховище
+користувачів, паролі, агрегати замовлень, читання файлів шматками, стиснення, діагностика). Модулі імпортуються напряму з тек сервісів, як у benchmarks/.
+"""
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "product-service"))
+sys.path.insert(0, os.path.join(ROOT, "auth-service"))
+sys.path.insert(0, os.path.join(ROOT, "order-service"))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+
+import gzip  # noqa: E402
+import importlib.util  # noqa: E402
+import json  # noqa: E402
+import random  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from array import array  # noqa: E402
+
+import passwords  # noqa: E402
+import compression  # noqa: E402
+import search  # noqa: E402
+import stats  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+import httpx  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from auth_client import AuthUnavailable, WhoamiBatcher  # noqa: E402
+from catalog import Catalog, CatalogFormatError, CatalogStore, load_file as load_feed  # noqa: E402
+from filestore import iter_chunks  # noqa: E402
+from diagnostics import Diagnostics, InflightCounter, LoopLagMonitor, ProfilerBusy, SamplingProfiler  # noqa: E402
+from compression import BodyCache, CompressionMiddleware, negotiate  # noqa: E402
+from stats import OrderStats, TimeBuckets, TopK  # noqa: E402
+from search import ProductSearch, QueryTooBroad, SearchIndex, tokenize  # noqa: E402
+from passwords import HasherBusy, PasswordHasher, hash_password, verify_password  # noqa: E402
+from userstore import UserFileFormatError, UserStore, UserTable, load_file as load_users  # noqa: E402
+
+
+# ============================================
+# PRODUCT SERVICE: ФІДИ КАТАЛОГУ
+# ============================================
+
+def test_feed_csv_with_bom_crlf_and_blank_rows(tmp_path):
+    """CSV з BOM, CRLF і порожніми рядками завантажується; зайві колонки ігноруються"""
+    path = tmp_path / "feed.csv"
+    path.write_bytes(
+        b"\xef\xbb\xbfproduct_id,name,price,inStock,vendor\r\n"
+        b"100,Keyboard,59.99,5,acme\r\n"
+        b"\r\n"
+        b'101,"Mouse, wireless",29.99,0,acme\r\n'
+    )
+
+    catalog, stats = load_feed(str(path))
+
+    assert stats.rows == 2
+    assert catalog.get(100) == {"product_id": 100, "name": "Keyboard", "price": "59.99", "inStock": 5}
+    assert catalog.get(101)["name"] == "Mouse, wireless"
+    assert catalog.get(102) is None
+    print("✅ CSV-фід з BOM і CRLF завантажується")
+
+
+def test_feed_jsonl(tmp_path):
+    """JSONL-фід: один товар на рядок, порожні рядки пропускаються"""
+    path = tmp_path / "feed.jsonl"
+    path.write_text(
+        '{"product_id": 1, "name": "Hub", "price": "9.99", "inStock": 3}\n'
+        "\n"
+        '{"product_id": 2, "name": "Cable", "price": "1.99", "inStock": 0}\r\n'
+    )
+
+    catalog, stats = load_feed(str(path))
+
+    assert stats.rows == 2
+    assert [p["name"] for p in catalog.items()] == ["Hub", "Cable"]
+    print("✅ JSONL-фід завантажується")
+
+
+@pytest.mark.parametrize("name, content", [
+    ("bad_id.csv", b"product_id,name,price,inStock\nabc,Keyboard,1.00,1\n"),
+    ("short_row.csv", b"product_id,name,price,inStock\n100,Keyboard\n"),
+    ("missing_column.csv", b"product_id,name,price\n100,Keyboard,1.00\n"),
+    ("not_utf8.csv", b"product_id,name,price,inStock\n100,\xff\xfe,1.00,1\n"),
+    ("empty.csv", b""),
+    ("bad_json.jsonl", b'{"product_id": 1,\n'),
+    ("missing_key.jsonl", b'{"product_id": 1, "name": "Hub"}\n'),
+    ("feed.xml", b"<products/>"),
+])
+def test_feed_bad_input_raises_format_error(tmp_path, name, content):
+    """Будь-який некоректний фід — це CatalogFormatError, а не довільний виняток"""
+    path = tmp_path / name
+    path.write_bytes(content)
+
+    with pytest.raises(CatalogFormatError):
+        load_feed(str(path))
+    print(f"✅ Некоректний фід {name} відхилено")
+
+
+def test_feed_watch_keeps_catalog_on_bad_feed(tmp_path):
+    """Поганий фід не зупиняє перевірку: лишається старий каталог, а виправлений фід підхоплюється"""
+    path = tmp_path / "feed.csv"
+    path.write_text("product_id,name,price,inStock\n1,Old,1.00,1\n")
+
+    async def scenario():
+        store = CatalogStore((await asyncio.to_thread(load_feed, str(path)))[0])
+        watcher = asyncio.create_task(store.watch(str(path), 0.01))
+        try:
+            path.write_bytes(b"product_id,name,price,inStock\n\xff,Broken,1.00,1\n")
+            os.utime(path, (1, 1))
+            await asyncio.sleep(0.1)
+            assert store.current.get(1)["name"] == "Old"
+
+            path.write_text("product_id,name,price,inStock\n1,New,1.00,1\n")
+            os.utime(path, (2, 2))
+            await asyncio.sleep(0.1)
+            assert not watcher.done()
+            assert store.current.get(1)["name"] == "New"
+        finally:
+            watcher.cancel()
+
+    asyncio.run(scenario())
+    print("✅ Перевірка фіду переживає поганий файл")
+
+
+# ============================================
+# PRODUCT SERVICE: ПОШУК
+# ============================================
+
+def make_catalog(names: list[str], first_id: int = 0) -> Catalog:
+    ids = array("q", range(first_id, first_id + len(names)))
+    return Catalog(ids, names, ["1.00"] * len(names), array("q", [1]) * len(names))
+
+
+def skewed_names(count: int, seed: int) -> list[str]:
+    """Назви з нерівномірним словником: w0, w1, ... найчастіші, є префікси одне одного"""
+    rnd = random.Random(seed)
+    words = [f"w{i}" for i in range(300)] + ["keyboard", "key", "mouse", "monitor", "wire", "wireless"]
+    weights = [1 / (i + 1) ** 0.5 for i in range(len(words))]
+    return [" ".join(rnd.choices(words, weights=weights, k=rnd.randint(2, 5))) for _ in range(count)]
+
+
+def brute_force_search(catalog: Catalog, query: str) -> list[int]:
+    """Усі збіги повним переглядом каталогу, у порядку ранжування SearchIndex.search"""
+    tokens = list(dict.fromkeys(tokenize(query)))
+    scores = {}
+    for pid, name in zip(catalog.ids, catalog.names):
+        terms = tokenize(name)
+        score = 0
+        for token in tokens:
+            if token in terms:
+                score += search.EXACT_WEIGHT
+            elif any(term.startswith(token) for term in terms):
+                score += search.PREFIX_WEIGHT
+            else:
+                break
+        else:
+            scores[pid] = score
+    return [pid for pid, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))]
+
+
+SEARCH_QUERIES = [
+    "w0", "w1", "w", "key", "keyboard", "wire mo", "w0 w1", "w1 keyboard", "w0 w",
+    "w2 w3 w4", "key w", "w29 w1", "w1 w", "monitor w0", "nothing here",
+]
+
+
+@pytest.mark.parametrize("max_candidates, max_prefix_terms", [(4000, 256), (50, 256), (0, 8), (0, 1)])
+def test_search_matches_brute_force(monkeypatch, max_candidates, max_prefix_terms):
+    """
+    Сторінка завжди збігається з повним переглядом, а точний total — з кількістю збігів.
+    Малі межі змушують працювати перебір за назвами та обрізане розгортання префіксів.
+    """
+    monkeypatch.setattr(search, "MAX_CANDIDATES", max_candidates)
+    monkeypatch.setattr(search, "MAX_PREFIX_TERMS", max_prefix_terms)
+    catalog = make_catalog(skewed_names(3000, seed=1))
+    index = SearchIndex.build(catalog)
+
+    for query in SEARCH_QUERIES:
+        expected = brute_force_search(catalog, query)
+        for limit, offset in ((10, 0), (10, 25), (100, 0)):
+            try:
+                result = index.search(query, limit, offset)
+            except QueryTooBroad:
+                continue
+            assert result.pids == expected[offset:offset + limit], (query, offset)
+            if result.total_exact:
+                assert result.total == len(expected), query
+    print(f"✅ Пошук збігається з повним переглядом (MAX_CANDIDATES={max_candidates})")
+
+
+def test_search_finds_rare_intersection_of_frequent_words(monkeypatch):
+    """Два часті слова, що разом трапляються рідко: збіги не губляться через обмеження перебору"""
+    monkeypatch.setattr(search, "MAX_CANDIDATES", 100)
+    names = ["usb adapter"] * 1000 + ["cable tie"] * 1000 + ["usb cable", "cable usb black"]
+    catalog = make_catalog(names)
+    index = SearchIndex.build(catalog)
+
+    result = index.search("usb cable", 10)
+
+    assert result.pids == [2000, 2001]
+    assert result.total == 2 and result.total_exact
+    print("✅ Рідкісний перетин частих слів знайдено")
+
+
+def test_search_refuses_too_broad_prefix(monkeypatch):
+    """Префікс, що розгортається в надто багато термів, відхиляється, а не дає неточну сторінку"""
+    monkeypatch.setattr(search, "MAX_PREFIX_TERMS", 4)
+    index = SearchIndex.build(make_catalog([f"w{i} item" for i in range(100)]))
+
+    with pytest.raises(QueryTooBroad):
+        index.search("w", 10)
+    # Повний токен з достатньою кількістю повних збігів лишається доступним
+    result = index.search("item", 10)
+    assert result.pids == list(range(10)) and result.total == 100
+    print("✅ Надто широкий префікс відхилено")
+
+
+def test_search_index_incremental_update_equals_rebuild():
+    """Після підміни знімка індекс, оновлений на місці, такий самий, як побудований з нуля"""
+    rnd = random.Random(7)
+    names = skewed_names(2000, seed=2)
+    old = make_catalog(names)
+    new_names = list(names)
+    for i in rnd.sample(range(len(names)), 150):
+        new_names[i] = skewed_names(1, seed=i)[0]
+    # Частина товарів зникає, частина з'являється
+    new = Catalog(
+        array("q", list(range(50, 2000)) + list(range(5000, 5100))),
+        new_names[50:] + skewed_names(100, seed=3),
+        ["1.00"] * 2050,
+        array("q", [1]) * 2050,
+    )
+
+    product_search = ProductSearch(old)
+    asyncio.run(product_search.on_catalog_swap(old, new))
+    rebuilt = SearchIndex.build(new)
+
+    assert product_search.index._terms == rebuilt._terms
+    assert product_search.index._postings == rebuilt._postings
+    for query in SEARCH_QUERIES:
+        try:
+            assert product_search.index.search(query, 20) == rebuilt.search(query, 20)
+        except QueryTooBroad:
+            with pytest.raises(QueryTooBroad):
+                rebuilt.search(query, 20)
+    print("✅ Інкрементне оновлення індексу дорівнює перебудові")
+
+
+# ============================================
+# AUTH SERVICE: ПАРОЛІ
+# ============================================
+
+def test_password_hash_roundtrip():
+    """Хеш містить алгоритм і параметри; перевіряється лише правильний пароль"""
+    encoded = hash_password("alice123")
+
+    assert encoded.startswith("scrypt$")
+    assert "alice123" not in encoded
+    assert verify_password("alice123", encoded)
+    assert not verify_password("alice124", encoded)
+    print("✅ scrypt-хеш перевіряється")
+
+
+def test_password_old_parameters_still_verify(monkeypatch):
+    """Хеш, створений з іншими параметрами чи алгоритмом, перевіряється за власним записом"""
+    monkeypatch.setattr(passwords, "KDF", "pbkdf2_sha256")
+    monkeypatch.setattr(passwords, "PBKDF2_ITERATIONS", 1000)
+    pbkdf2_hash = hash_password("bob123")
+    monkeypatch.setattr(passwords, "KDF", "scrypt")
+    monkeypatch.setattr(passwords, "SCRYPT_N", 32768)
+    # N = 32768 потребує 32 МіБ — більше за типовий ліміт OpenSSL
+    scrypt_hash = hash_password("bob123")
+
+    assert pbkdf2_hash.startswith("pbkdf2_sha256$1000$")
+    assert scrypt_hash.startswith("scrypt$32768$")
+    assert verify_password("bob123", pbkdf2_hash)
+    assert verify_password("bob123", scrypt_hash)
+    print("✅ Хеші з різними параметрами перевіряються")
+
+
+@pytest.mark.parametrize("encoded", [
+    "",
+    "plaintext-password",
+    "md5$abc",
+    "scrypt$16384$8",
+    "scrypt$abc$8$1$AAAA$AAAA",
+    "scrypt$1000$8$1$AAAA$AAAA",
+    "scrypt$16384$8$1$not*base64$AAAA",
+    "pbkdf2_sha256$1000$AAAA",
+    "pbkdf2_sha256$1000$AAAA$%%%",
+])
+def test_password_malformed_hash_is_rejected(encoded):
+    """Пошкоджений збережений хеш — невдалий логін, а не виняток"""
+    assert verify_password("anything", encoded) is False
+    print(f"✅ Пошкоджений хеш {encoded!r} відхилено")
+
+
+def test_password_hasher_rejects_when_queue_full():
+    """Коли черга перевірок заповнена, новий логін одразу отримує HasherBusy"""
+    encoded = hash_password("alice123")
+
+    async def scenario():
+        hasher = PasswordHasher(workers=1, max_pending=1)
+        try:
+            first = asyncio.create_task(hasher.verify("alice123", encoded))
+            await asyncio.sleep(0)
+            with pytest.raises(HasherBusy):
+                await hasher.verify("alice123", encoded)
+            assert await first
+            # Черга звільнилась — перевірки знову приймаються
+            assert await hasher.verify("alice123", encoded)
+        finally:
+            hasher.shutdown()
+
+    asyncio.run(scenario())
+    print("✅ Переповнена черга перевірок паролів відмовляє одразу")
+
+
+# ============================================
+# AUTH SERVICE: СХОВИЩЕ КОРИСТУВАЧІВ
+# ============================================
+
+def test_user_table_load_and_lookup(tmp_path):
+    """Файл із заголовком, CRLF і порожніми рядками; при дублікатах email — перший запис"""
+    path = tmp_path / "users.csv"
+    path.write_bytes(
+        b"email,id,password_hash\r\n"
+        b"alice@example.com,1,scrypt$a\r\n"
+        b"\r\n"
+        b"bob@example.com,2,pbkdf2_sha256$b\n"
+        b"alice@example.com,3,scrypt$dup\n"
+    )
+
+    table, stats = load_users(str(path))
+
+    assert stats.users == len(table) == 3
+    assert table.lookup("alice@example.com") == (1, "scrypt$a")
+    assert table.lookup("bob@example.com") == (2, "pbkdf2_sha256$b")
+    assert table.lookup("carol@example.com") is None
+    assert table.lookup("ALICE@example.com") is None
+    print("✅ Таблиця користувачів завантажується, пошук працює")
+
+
+def test_user_table_survives_in_place_rewrite(tmp_path):
+    """Таблиця не залежить від файлу після завантаження: його можна переписати чи видалити"""
+    path = tmp_path / "users.csv"
+    path.write_text("alice@example.com,1,h1\nbob@example.com,2,h2\n")
+    table, _ = load_users(str(path))
+
+    with open(path, "w") as f:
+        f.write("carol@example.com,3,h3\n")
+    assert table.lookup("bob@example.com") == (2, "h2")
+    path.unlink()
+    assert table.lookup("alice@example.com") == (1, "h1")
+    print("✅ Переписаний файл не впливає на завантажену таблицю")
+
+
+@pytest.mark.parametrize("content", [
+    b"alice@example.com\n",
+    b"alice@example.com,not-a-number,h1\n",
+])
+def test_user_table_bad_row_raises_format_error(tmp_path, content):
+    """Некоректний рядок — UserFileFormatError"""
+    path = tmp_path / "users.csv"
+    path.write_bytes(content)
+
+    with pytest.raises(UserFileFormatError):
+        load_users(str(path))
+    print("✅ Некоректний файл користувачів відхилено")
+
+
+def test_user_store_reload_on_change(tmp_path):
+    """Зміна файлу підхоплюється, поганий файл лишає попередню таблицю"""
+    path = tmp_path / "users.csv"
+    path.write_text("alice@example.com,1,h1\n")
+
+    async def scenario():
+        store = UserStore(UserTable.from_records([]))
+        await store.load(str(path))
+        assert store.current.lookup("alice@example.com") == (1, "h1")
+
+        watcher = asyncio.create_task(store.watch(str(path), 0.01))
+        try:
+            path.write_text("alice@example.com\n")
+            os.utime(path, (1, 1))
+            await asyncio.sleep(0.1)
+            assert store.current.lookup("alice@example.com") == (1, "h1")
+
+            path.write_text("alice@example.com,1,h1\nbob@example.com,2,h2\n")
+            os.utime(path, (2, 2))
+            await asyncio.sleep(0.1)
+            assert not watcher.done()
+            assert store.current.lookup("bob@example.com") == (2, "h2")
+        finally:
+            watcher.cancel()
+
+    asyncio.run(scenario())
+    print("✅ Сховище користувачів перечитує змінений файл")
+
+
+# ============================================
+# ORDER SERVICE: АГРЕГАТИ ЗАМОВЛЕНЬ
+# ============================================
+
+def test_top_k_evicts_smallest_and_tracks_error():
+    """Space-Saving: новий ключ витісняє найменший і успадковує його лічильник як похибку"""
+    top = TopK(2)
+    for key, quantity in [("a", 1), ("a", 2), ("a", 3), ("b", 5), ("c", 7)]:
+        top.add(key, quantity)
+
+    assert top.top("product_id") == [
+        {"product_id": "a", "orders": 3, "quantity": 6, "orders_error": 0},
+        {"product_id": "c", "orders": 2, "quantity": 7, "orders_error": 1},
+    ]
+
+    # Гарантована нижня межа (orders - orders_error) не перевищує справжню кількість
+    top.add("b", 1)
+    entry = next(e for e in top.top("product_id") if e["product_id"] == "b")
+    assert entry["orders"] - entry["orders_error"] <= 2 <= entry["orders"]
+    print("✅ TopK витісняє найменший ключ і рахує похибку")
+
+
+def test_time_buckets_reuse_slots_and_drop_late_orders():
+    """Комірка кільця переходить до нового інтервалу; замовлення старші за вікно відкидаються"""
+    buckets = TimeBuckets(bucket_seconds=60, buckets=3)
+    buckets.add(0, 1)
+    buckets.add(61, 2)
+    assert buckets.series(120) == [
+        {"start": 0, "orders": 1, "quantity": 1},
+        {"start": 60, "orders": 1, "quantity": 2},
+    ]
+
+    # Після тихих хвилин та сама комірка (180 // 60 % 3 == 0) належить новому інтервалу
+    buckets.add(185, 4)
+    assert buckets.series(185) == [
+        {"start": 60, "orders": 1, "quantity": 2},
+        {"start": 180, "orders": 1, "quantity": 4},
+    ]
+
+    # Запізніле замовлення ще у вікні потрапляє у свій інтервал, старіше — відкидається
+    buckets.add(130, 5)
+    buckets.add(5, 100)
+    assert buckets.series(185) == [
+        {"start": 60, "orders": 1, "quantity": 2},
+        {"start": 120, "orders": 1, "quantity": 5},
+        {"start": 180, "orders": 1, "quantity": 4},
+    ]
+    print("✅ TimeBuckets перевикористовує комірки й відкидає старі замовлення")
+
+
+def test_order_stats_snapshot_rebuilt_on_new_interval(monkeypatch):
+    """Кешований знімок перебудовується на новому замовленні й на початку нового інтервалу"""
+    now = [600.0]
+    monkeypatch.setattr(stats.time, "time", lambda: now[0])
+    order_stats = OrderStats(top_k=10, bucket_seconds=60, buckets=2)
+    order_stats.record({"product_id": 100, "quantity": 2, "user_email": "alice@example.com"})
+
+    first = order_stats.snapshot()
+    assert order_stats.snapshot() is first
+    assert first["by_time"] == [{"start": 600, "orders": 1, "quantity": 2}]
+
+    now[0] = 665.0
+    second = order_stats.snapshot()
+    assert second is not first
+    assert second["by_time"] == [{"start": 600, "orders": 1, "quantity": 2}]
+
+    # Інтервал вийшов з вікна — знімок більше його не показує, підсумки лишаються
+    now[0] = 725.0
+    third = order_stats.snapshot()
+    assert third["by_time"] == []
+    assert third["orders"] == 1 and third["quantity"] == 2
+
+    order_stats.record({"product_id": 101, "quantity": 1, "user_email": None})
+    fourth = order_stats.snapshot()
+    assert fourth["orders"] == 2
+    assert fourth["by_user"] == [{"user_email": "alice@example.com", "orders": 1, "quantity": 2, "orders_error": 0}]
+    print("✅ Знімок агрегатів перебудовується з новим інтервалом")
+
+
+def whoami_transport(batches, respond=None):
+    """MockTransport /whoami:batch: запам'ятовує пакети й відповідає як auth-service"""
+    def handler(request):
+        tokens = json.loads(request.content)["tokens"]
+        batches.append(tokens)
+        if respond is not None:
+            return respond(tokens)
+        return httpx.Response(200, json={"results": [{"email": token.removeprefix("Bearer ")} for token in tokens]})
+
+    return httpx.MockTransport(handler)
+
+
+def test_whoami_batcher_window_flush_and_dedup():
+    """Перевірки в межах вікна йдуть одним пакетом; однаковий токен відправляється один раз"""
+    batches = []
+
+    async def scenario():
+        batcher = WhoamiBatcher("http://auth", window=0.05, max_batch=100, transport=whoami_transport(batches))
+        try:
+            results = await asyncio.gather(
+                batcher.whoami("Bearer a"), batcher.whoami("Bearer b"), batcher.whoami("Bearer a")
+            )
+            assert results == [{"email": "a"}, {"email": "b"}, {"email": "a"}]
+            assert batches == [["Bearer a", "Bearer b"]]
+
+            # Наступна перевірка після відповіді — вже новий пакет
+            assert await batcher.whoami("Bearer c") == {"email": "c"}
+            assert batches[1:] == [["Bearer c"]]
+        finally:
+            await batcher.aclose()
+
+    asyncio.run(scenario())
+    print("✅ WhoamiBatcher об'єднує перевірки у вікні та не дублює токени")
+
+
+def test_whoami_batcher_flushes_at_max_batch_without_waiting_window():
+    """Набраний max_batch відправляється одразу, решта чекає наступного пакета"""
+    batches = []
+
+    async def scenario():
+        batcher = WhoamiBatcher("http://auth", window=30, max_batch=2, transport=whoami_transport(batches))
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(batcher.whoami("Bearer a"), batcher.whoami("Bearer a"), batcher.whoami("Bearer b")),
+                timeout=5,
+            )
+            assert results == [{"email": "a"}, {"email": "a"}, {"email": "b"}]
+            assert batches == [["Bearer a", "Bearer b"]]
+
+            third = asyncio.ensure_future(batcher.whoami("Bearer c"))
+            await asyncio.sleep(0.05)
+            assert not third.done()
+        finally:
+            await batcher.aclose()
+        # aclose відправляє те, що лишилось у черзі
+        assert await third == {"email": "c"}
+        assert batches[1:] == [["Bearer c"]]
+
+    asyncio.run(scenario())
+    print("✅ WhoamiBatcher відправляє повний пакет без очікування вікна")
+
+
+@pytest.mark.parametrize("respond", [
+    lambda tokens: httpx.Response(200, json={"results": [{"email": "x"}]}),
+    lambda tokens: httpx.Response(422, json={"detail": "too many tokens"}),
+    lambda tokens: httpx.Response(200, content=b"not json"),
+], ids=["result-count", "non-2xx", "malformed"])
+def test_whoami_batcher_fails_every_waiter_when_auth_unavailable(respond):
+    """Будь-яка неочікувана відповідь — AuthUnavailable для кожного очікувача пакета"""
+    batches = []
+
+    async def scenario():
+        batcher = WhoamiBatcher("http://auth", window=0.01, max_batch=100, transport=whoami_transport(batches, respond))
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    batcher.whoami("Bearer a"), batcher.whoami("Bearer b"), batcher.whoami("Bearer a"),
+                    return_exceptions=True,
+                ),
+                timeout=5,
+            )
+            assert len(batches) == 1
+            assert all(isinstance(result, AuthUnavailable) for result in results)
+        finally:
+            await batcher.aclose()
+
+    asyncio.run(scenario())
+    print("✅ WhoamiBatcher не залишає очікувачів без відповіді")
+
+
+# ============================================
+# ЗНІМКИ З ФАЙЛІВ
+# ============================================
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 7, 64])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_iter_chunks_splits_only_on_line_boundaries(chunk_size, trailing_newline):
+    """Шматки не розрізають рядків (і довших за шматок теж), зсуви вказують на початок шматка"""
+    lines = ["a", "", "bbbbbbbbbbbb", "cc", "ї"]
+    data = ("\n".join(lines) + ("\n" if trailing_newline else "")).encode()
+
+    chunks = list(iter_chunks(data, chunk_size=chunk_size))
+    assert [line for _, chunk in chunks for line in chunk] == [line.encode() for line in lines]
+    for offset, chunk in chunks:
+        assert data[offset:].startswith(b"\n".join(chunk))
+
+    decoded = list(iter_chunks(data, start=2, encoding="utf-8", chunk_size=chunk_size))
+    assert [line for _, chunk in decoded for line in chunk] == lines[1:]
+    print(f"✅ iter_chunks (chunk_size={chunk_size}) ріже лише по межі рядка")
+
+
+# ============================================
+# СТИСНЕННЯ ВІДПОВІДЕЙ
+# ============================================
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("gzip;q=0, deflate", None),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=abc", None),
+])
+def test_negotiate_accept_encoding(accept_encoding, expected):
+    """Кодування обирається з Accept-Encoding з урахуванням q; q=0 забороняє кодування"""
+    assert negotiate(accept_encoding) == expected
+    print(f"✅ Accept-Encoding {accept_encoding!r} -> {expected}")
+
+
+def test_negotiate_wildcard_uses_server_preference():
+    """На "*" сервер обирає найкраще з доступних кодувань, явне q=0 його виключає"""
+    best = negotiate("*")
+    assert best is not None
+    assert negotiate(f"*, {best};q=0") != best
+    print("✅ Accept-Encoding: * працює")
+
+
+def test_compression_middleware():
+    """Велика відповідь стискається узгодженим кодуванням, мала та без Accept-Encoding — ні"""
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, skip_paths={"/self-compressed"})
+    payload = {"items": [{"product_id": i, "name": f"Product {i}"} for i in range(200)]}
+
+    @app.get("/big")
+    async def big():
+        return payload
+
+    @app.get("/big-with-vary")
+    async def big_with_vary():
+        return JSONResponse(payload, headers={"Vary": "Accept-Encoding"})
+
+    @app.get("/self-compressed")
+    async def self_compressed():
+        return payload
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        compressed = client.get("/big", headers={"Accept-Encoding": "gzip"})
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.headers["vary"] == "Accept-Encoding"
+        assert compressed.json() == payload
+
+        # Vary, виставлений обробником, не дублюється
+        with_vary = client.get("/big-with-vary", headers={"Accept-Encoding": "gzip"})
+        assert with_vary.headers["content-encoding"] == "gzip"
+        assert with_vary.headers["vary"] == "Accept-Encoding"
+
+        # Без стиснення для цього клієнта, але для інших стиснули б — Vary однаково потрібен
+        plain = client.get("/big", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.headers["vary"] == "Accept-Encoding"
+        assert plain.json() == payload
+
+        small_response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small_response.headers
+        assert "vary" not in small_response.headers
+
+        skipped = client.get("/self-compressed", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in skipped.headers
+        assert skipped.json() == payload
+    print("✅ CompressionMiddleware стискає лише великі відповіді")
+
+
+def test_body_cache_compresses_once_and_never_blocks_identity(monkeypatch):
+    """Рендер і стиснення — по одному на джерело; запити з gzip чекають на спільне стиснення"""
+    renders = []
+    compressions = []
+    compress_sync = compression.compress_sync
+
+    def render(source):
+        renders.append(source)
+        return (source * 2000).encode()
+
+    def counting_compress(body, encoding, level):
+        compressions.append(encoding)
+        return compress_sync(body, encoding, level)
+
+    monkeypatch.setattr(compression, "compress_sync", counting_compress)
+
+    async def scenario():
+        cache = BodyCache(render, levels={"gzip": 9})
+        first, second = "a", "b"
+
+        results = await asyncio.gather(cache.get(first, None), cache.get(first, "gzip"), cache.get(first, "gzip"))
+        assert [encoding for _, encoding in results] == [None, "gzip", "gzip"]
+        assert results[1][0] is results[2][0]
+        assert gzip.decompress(results[1][0]) == b"a" * 2000
+        assert renders == [first]
+        assert compressions == ["gzip"]
+
+        # Нове джерело скидає кеш
+        body, encoding = await cache.get(second, None)
+        assert body == b"b" * 2000 and encoding is None
+        assert renders == [first, second]
+
+    asyncio.run(scenario())
+    print("✅ BodyCache рендерить і стискає раз на знімок")
+
+
+def test_body_cache_falls_back_to_identity_when_compression_is_slow(monkeypatch):
+    """Стиснення довше за wait — тіло без стиснення, а варіант добудовується для наступних запитів"""
+    release = threading.Event()
+    compress_sync = compression.compress_sync
+
+    def slow_compress(body, encoding, level):
+        release.wait(5)
+        return compress_sync(body, encoding, level)
+
+    monkeypatch.setattr(compression, "compress_sync", slow_compress)
+    monkeypatch.setattr(compression, "COMPRESSION_OFFLOAD_SIZE", 0)
+
+    async def scenario():
+        cache = BodyCache(lambda source: source * 2000, wait=0.05)
+        body, encoding = await asyncio.wait_for(cache.get(b"a", "gzip"), timeout=1)
+        assert body == b"a" * 2000 and encoding is None
+        body, encoding = await asyncio.wait_for(cache.get(b"a", None), timeout=1)
+        assert encoding is None
+
+        release.set()
+        body, encoding = await cache.get(b"a", "gzip")
+        assert encoding == "gzip" and gzip.decompress(body) == b"a" * 2000
+
+    asyncio.run(scenario())
+    print("✅ BodyCache не тримає запит довше за wait")
+
+
+# ============================================
+# ДІАГНОСТИКА
+# ============================================
+
+def test_loop_lag_monitor_records_stall_with_stack():
+    """Блокуючий time.sleep в async-обробнику фіксується з тривалістю та стеком обробника"""
+    diagnostics = Diagnostics()
+    diagnostics.loop_lag = LoopLagMonitor(threshold=0.05, history=10)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        diagnostics.start()
+        yield
+        diagnostics.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(diagnostics.router())
+
+    @app.get("/block")
+    async def blocking_handler():
+        time.sleep(0.3)
+        return {}
+
+    with TestClient(app) as client:
+        assert client.get("/admin/loop-lag").json()["total_stalls"] == 0
+        client.get("/block")
+        # Блокування записується, коли сторож побачить нове серцебиття
+        deadline = time.monotonic() + 2
+        while diagnostics.loop_lag.total_stalls == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        snapshot = client.get("/admin/loop-lag").json()
+
+    assert snapshot["total_stalls"] == 1
+    stall = snapshot["stalls"][0]
+    assert 200 <= stall["duration_ms"] <= 1000
+    assert "blocking_handler" in stall["stack"]
+    assert stall["stack"].startswith("thread:event-loop;")
+    print("✅ LoopLagMonitor фіксує блокування циклу разом зі стеком")
+
+
+def test_sampling_profiler_collapsed_stacks_and_busy():
+    """Рядки профілю — "стек кількість"; паралельне знімання відхиляється"""
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name="busy-worker")
+    worker.start()
+
+    async def scenario():
+        profiler = SamplingProfiler()
+        capture = asyncio.ensure_future(profiler.capture(0.2, 0.005))
+        await asyncio.sleep(0)
+        with pytest.raises(ProfilerBusy):
+            await profiler.capture(0.1, 0.005)
+        output = await capture
+        assert not profiler.running
+        return output
+
+    try:
+        output = asyncio.run(scenario())
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = output.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and " " not in stack
+    assert any(line.startswith("thread:busy-worker;") and "busy_worker" in line for line in lines)
+    print("✅ SamplingProfiler повертає collapsed stacks і не знімає два профілі одночасно")
+
+
+def test_inflight_counter_current_and_peak():
+    """Поточна кількість очікувань зменшується після виходу, пік зберігається"""
+    counter = InflightCounter()
+    with counter.track("auth-service"):
+        with counter.track("auth-service"):
+            assert counter.snapshot() == {"auth-service": {"awaiting": 2, "peak": 2}}
+        with pytest.raises(RuntimeError):
+            with counter.track("product-service"):
+                raise RuntimeError("downstream failed")
+    assert counter.snapshot() == {
+        "auth-service": {"awaiting": 0, "peak": 2},
+        "product-service": {"awaiting": 0, "peak": 1},
+    }
+    print("✅ InflightCounter рахує поточні очікування та пік")
+
+
+def test_admin_routes_enabled_in_service(monkeypatch):
+    """ADMIN_ENABLED=1 підключає /admin/* до сервісу; без нього маршрутів немає"""
+    def load_order_service(admin_enabled):
+        monkeypatch.setenv("ADMIN_ENABLED", admin_enabled)
+        spec = importlib.util.spec_from_file_location(
+            f"order_service_main_{admin_enabled}", os.path.join(ROOT, "order-service", "main.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    service = load_order_service("1")
+    with TestClient(service.app) as client:
+        assert client.get("/admin/inflight").json() == {}
+        assert client.get("/admin/loop-lag").json()["total_stalls"] == 0
+        profile = client.get("/admin/profile", params={"seconds": 0.05, "interval_ms": 5})
+        assert profile.status_code == 200
+        assert "thread:" in profile.text
+        assert client.get("/admin/profile", params={"seconds": 0}).status_code == 422
+
+    service = load_order_service("0")
+    with TestClient(service.app) as client:
+        assert client.get("/admin/inflight").status_code == 404
+    print("✅ Адмін-маршрути діагностики вмикаються через ADMIN_ENABLED")